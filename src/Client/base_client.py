@@ -1,14 +1,21 @@
-from Gateway import Gateway
+from Gateway import Gateway, GatewayEvent
+from utils import LoopBridge
 from threading import Event
-from typing import List
+from typing import List, Tuple
+import asyncio
+import logging
 
 class BaseClient(object):
     NAME = "Base Strategy"
+    # event kinds that wake an async client, None for every kind
+    EVENT_KINDS: Tuple[str, ...] = None
 
     def __init__(self, gateways: List[Gateway], **general_params):
         self._gateways: List[Gateway] = gateways
         self._eflag: Event = Event()
         self._general_params = general_params
+        self._events: asyncio.Queue = None
+        self._bridge: LoopBridge = None
 
     def begin(self):
         for gw in self._gateways:
@@ -16,8 +23,68 @@ class BaseClient(object):
 
     def end(self):
         raise NotImplementedError(f"Strategy.end() not implemented for {self.NAME}")
-    
-    def __repr__(self):
-        return self.NAME
 
+    @classmethod
+    def is_async(cls) -> bool:
+        """True when the client implements the async lifecycle, it then runs as a task on the engine loop instead of a thread."""
+        return any(getattr(cls, name) is not getattr(BaseClient, name) for name in ("on_start", "on_event", "on_stop"))
+
+    async def on_start(self):
+        pass
+
+    async def on_event(self, event: GatewayEvent):
+        pass
+
+    async def on_stop(self):
+        pass
+
+    async def run(self):
+        """Async lifecycle: on_start, then on_event for every gateway event until stop(), then on_stop.
+
+        Gateways may publish from their own threads, events are handed to the loop in batches
+        through a LoopBridge and handled one at a time in publication order. Listeners are
+        registered before on_start, so events published while it runs are queued and handled
+        once it returns.
+        """
+        BaseClient.begin(self)
+        self._events = asyncio.Queue()
+        self._bridge = LoopBridge(asyncio.get_running_loop(), self._enqueue)
+        for gw in self._gateways:
+            gw.addListener(self._post_event)
+        try:
+            await self.on_start()
+            if self._events.qsize():
+                logging.info(f"{self.NAME} handling {self._events.qsize()} events queued during startup")
+            while not self._eflag.is_set():
+                event = await self._events.get()
+                if event is None:
+                    break
+                try:
+                    await self.on_event(event)
+                except Exception as e:
+                    logging.error(f"{self.NAME} failed on {event.kind} event from {event.source}: {e}")
+        finally:
+            for gw in self._gateways:
+                gw.removeListener(self._post_event)
+            await self.on_stop()
+
+    def stop(self):
+        """Ends run(), callable from any thread."""
+        self._eflag.set()
+        if self._bridge is not None:
+            self._bridge.post(None)
+
+    def _post_event(self, event: GatewayEvent):
+        if self.EVENT_KINDS is None or event.kind in self.EVENT_KINDS:
+            self._bridge.post(event)
+
+    def _pending_events(self) -> int:
+        """Number of events queued behind the one being handled."""
+        return self._events.qsize() + self._bridge.backlog()
 
+    def _enqueue(self, batch: list):
+        for event in batch:
+            self._events.put_nowait(event)
+
+    def __repr__(self):
+        return self.NAME
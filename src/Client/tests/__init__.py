@@ -1 +1,3 @@
-from .tws_tests import *
\ No newline at end of file
+from .tws_tests import *
+from .pairs_features_tests import *
+from .pairs_inference_tests import *
\ No newline at end of file
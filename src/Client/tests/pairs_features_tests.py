@@ -0,0 +1,73 @@
+from ..base_client import BaseClient
+from Strategy.pairs_features import FEATURES, PairFeatureEngine, pair_features, reversal_labels
+import logging
+import numpy as np
+import pandas as pd
+
+class PairsFeaturesConsistencyTest(BaseClient):
+    NAME = "Pairs Features Unit Test"
+
+    def __init__(self, gateways, n_minutes: int = 20000, seed: int = 0, rtol: float = 1e-9, **general_params):
+        super().__init__(gateways, **general_params)
+        self.n_minutes = n_minutes
+        self.seed = seed
+        self.rtol = rtol
+
+    def begin(self):
+        super().begin()
+        rng = np.random.default_rng(self.seed)
+        close = pd.Series(1 + np.cumsum(rng.normal(0, 1e-3, self.n_minutes)),
+                          index=pd.date_range("2024-01-02 14:30", periods=self.n_minutes, freq="min", tz="UTC"))
+        batch = pair_features(close)[FEATURES].to_numpy()
+        engine = PairFeatureEngine()
+        streaming = np.array([engine.update(value) for value in close.to_numpy()])
+
+        assert np.array_equal(np.isnan(batch), np.isnan(streaming)), "warm-up rows differ between batch and streaming features"
+        mismatches = ~np.isclose(streaming, batch, rtol=self.rtol, atol=0, equal_nan=True)
+        for column, name in enumerate(FEATURES):
+            rows = np.flatnonzero(mismatches[:, column])
+            assert rows.size == 0, f"{name} differs from pair_features at {rows.size} rows, first at {close.index[rows[0]]}"
+        logging.info(f"Streaming pair features match pair_features over {self.n_minutes} minutes")
+
+    def end(self):
+        self._eflag.set()
+
+
+class ReversalLabelsConsistencyTest(BaseClient):
+    NAME = "Reversal Labels Unit Test"
+
+    def __init__(self, gateways, n_minutes: int = 2000, seed: int = 0, **general_params):
+        super().__init__(gateways, **general_params)
+        self.n_minutes = n_minutes
+        self.seed = seed
+
+    @staticmethod
+    def _loop_labels(df: pd.DataFrame) -> pd.Series:
+        # labeling loop reversal_labels replaced in PairsTradingStrategy.train
+        df = df.copy()
+        df["reversal"] = None
+        for num, idx in enumerate(df.index):
+            if num + 30 > len(df):
+                break
+            if any(df["close"].iloc[num:num+30] >= df["rolling_mean"].iloc[num:num+30] * 1.005) or any(df["close"].iloc[num:num+30] <= df["rolling_mean"].iloc[num:num+30] * 0.995):
+                df.loc[idx, "reversal"] = 1
+            else:
+                df.loc[idx, "reversal"] = 0
+        return df["reversal"]
+
+    def begin(self):
+        super().begin()
+        rng = np.random.default_rng(self.seed)
+        close = pd.Series(1 + np.cumsum(rng.normal(0, 1e-3, self.n_minutes)),
+                          index=pd.date_range("2024-01-02 14:30", periods=self.n_minutes, freq="min", tz="UTC"))
+        df = pair_features(close)
+        expected = self._loop_labels(df).to_numpy(dtype=np.float64)
+        labels = reversal_labels(df["close"], df["rolling_mean"]).to_numpy()
+
+        assert np.array_equal(np.isnan(expected), np.isnan(labels)), "unlabeled minutes differ from the labeling loop"
+        rows = np.flatnonzero(~np.isnan(expected) & (expected != labels))
+        assert rows.size == 0, f"reversal labels differ from the labeling loop at {rows.size} minutes, first at {close.index[rows[0]]}"
+        logging.info(f"Reversal labels match the labeling loop over {self.n_minutes} minutes, {int(np.nansum(labels))} reversals")
+
+    def end(self):
+        self._eflag.set()
@@ -0,0 +1,39 @@
+from ..base_client import BaseClient
+from Strategy.pairs_features import FEATURES
+from Strategy.pairs_inference import LinearScorer
+from Strategy.pairs_training import new_pipeline
+import logging
+import numpy as np
+
+class PairsScorerAlignmentTest(BaseClient):
+    NAME = "Pairs Scorer Unit Test"
+
+    def __init__(self, gateways, n_pairs: int = 5, seed: int = 0, **general_params):
+        super().__init__(gateways, **general_params)
+        self.n_pairs = n_pairs
+        self.seed = seed
+
+    def begin(self):
+        super().begin()
+        rng = np.random.default_rng(self.seed)
+        models = {}
+        for index in range(self.n_pairs):
+            model = new_pipeline()
+            X = rng.normal(size=(200, len(FEATURES)))
+            models[(f"A{index}", f"B{index}")] = model.fit(X, X @ rng.normal(size=len(FEATURES)) + index)
+        scorer = LinearScorer(models)
+
+        features = rng.normal(size=(len(scorer), len(FEATURES)))
+        # the first pair is still warming up
+        features[0, -1] = np.nan
+        keys, predictions, rows = scorer.score_ready(features)
+
+        assert keys == scorer.keys[1:], f"ready keys {keys} do not skip the warming up pair"
+        for key, prediction, row in zip(keys, predictions, rows):
+            assert np.array_equal(row, features[scorer.rows[key]]), f"feature row of {key} is misaligned"
+            expected = models[key].predict(row[None, :])[0]
+            assert np.isclose(prediction, expected, rtol=1e-9), f"prediction of {key} is {prediction}, pipeline gives {expected}"
+        logging.info(f"Scorer keys, predictions and features stay aligned with {len(scorer) - len(keys)} pair warming up")
+
+    def end(self):
+        self._eflag.set()
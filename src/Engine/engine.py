@@ -59,7 +59,7 @@ class Engine:
     async def launch(self):
         logging.debug("Launching streaming tasks")
         await self._launch_streams()
-        logging.debug("Launching client threads")
+        logging.debug("Launching clients")
         self._launch_clients()
         logging.debug("Launching CLI interface")
         logging.debug(f"Running with interactive set to {self._general_params['interactive']}")
@@ -80,7 +80,7 @@ class Engine:
             await asyncio.sleep(1)
 
     async def close(self):
-        self._close_clients()
+        await self._close_clients()
         await self._close_streams()
         exit(0)
 
@@ -88,13 +88,19 @@ class Engine:
         self.stream_tasks = []
         for gw_name, gw_obj in self.gateways.items():
             logging.debug(f"Launching {gw_name} stream")
-            task = asyncio.create_task(gw_obj.beginStream())
+            if asyncio.iscoroutinefunction(gw_obj.beginStream):
+                task = asyncio.create_task(gw_obj.beginStream())
+            else:
+                # blocking stream loops get their own thread so they cannot stall the engine loop
+                task = asyncio.create_task(asyncio.to_thread(gw_obj.beginStream))
             self.stream_tasks.append(task)
         await asyncio.sleep(2)
 
     async def _close_streams(self):
         for gw in self.gateways.values():
-            await gw.endStream()
+            result = gw.endStream()
+            if asyncio.iscoroutine(result):
+                await result
         for task in self.stream_tasks:
             await task
             print(colorama.Fore.BLUE, f"{task} stream task joined", colorama.Style.RESET_ALL)
@@ -102,12 +108,18 @@ class Engine:
     def _launch_clients(self):
         self.client_threads = []
         self.client_objs = []
+        self.client_tasks = []
         for client in get_leaf_classes(BaseClient):
             logging.debug(f"Analyzing {client}")
             if self._client_params and client.NAME in self._client_params:
                 logging.debug(f"Launching {client.NAME}")
                 gateways = [self.gateways[gw_name] for gw_name in self._client_params[client.NAME].pop("gateways")]
                 client_obj = client(gateways, **{**self._client_params[client.NAME], "template": self.template, **self._general_params})
+                if client.is_async():
+                    # event driven clients share the engine loop, woken by gateway events
+                    self.client_tasks.append((client_obj, asyncio.create_task(client_obj.run(), name=client.NAME)))
+                    logging.debug(f"{client.NAME} task started")
+                    continue
                 self.client_objs.append(client_obj)
                 client_thread = Thread(target=client_obj.begin, name=client.NAME)
                 logging.debug(f"Attached {client.NAME} object to thread named {client_thread.name}")
@@ -115,7 +127,15 @@ class Engine:
                 logging.debug(f"{client.NAME} thread started")
                 self.client_threads.append(client_thread)
 
-    def _close_clients(self):
+    async def _close_clients(self):
+        for client_obj, client_task in self.client_tasks:
+            logging.debug(f"Stopping {client_obj.NAME}")
+            client_obj.stop()
+            try:
+                await client_task
+            except Exception as e:
+                logging.error(f"{client_obj.NAME} task ended with an error: {e}")
+            logging.debug(f"{client_obj.NAME} task finished")
         for client_obj, client_thread in zip(self.client_objs, self.client_threads):
             logging.debug(f"Ending {client_obj.NAME}")
             client_obj.end()
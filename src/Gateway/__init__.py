@@ -1,5 +1,6 @@
-from .base_gateway import Gateway
+from .base_gateway import Gateway, GatewayEvent
 from .alpaca_gateway import AlpacaGateway
 from .tws_gateway import TWSGateway
 from .polymarket_gateway import PolymarketGateway
-from .kalshi_gateway import KalshiGateway
\ No newline at end of file
+from .kalshi_gateway import KalshiGateway
+from .replay_gateway import ReplayGateway
\ No newline at end of file
@@ -7,7 +7,15 @@ from alpaca_trade_api.entity import Quote
 import requests
 from enum import Enum
 import datetime as dt
-from pandas import DataFrame
+import time
+import logging
+from threading import Event, Lock, Thread
+from typing import Dict
+import pandas as pd
+from trading.quote_store import QuoteRing
+from trading.bar_aggregator import Bar, BarAggregator
+from .bar_cache import BarCache
+from .broker_state import BrokerState, PositionState
 
 class Product(Enum):
     STOCK = "stocks"
@@ -16,8 +24,11 @@ class AlpacaGateway(Gateway, REST, Stream):
     NAME = "AlpacaGateway"
     _base_url = 'https://paper-api.alpaca.markets'
     _data_base_url = 'https://data.alpaca.markets'
+    _quotes_dir = "data/alpaca_quotes"
+    _bars_dir = "data/alpaca_bars"
 
-    def __init__(self):
+    def __init__(self, quote_capacity: int = 1 << 16, spill_quotes: bool = False, bar_grace: float = 2.0,
+                 max_download_workers: int = 8, reconcile_interval: float = 30.0):
         REST.__init__(self, self._API_KEY, self._API_SECRET_KEY, URL(self._base_url), "v2")
 
         dotenv.load_dotenv(".config/.env")
@@ -29,27 +40,117 @@ class AlpacaGateway(Gateway, REST, Stream):
 
         self.watchlist = []
         self.latest_quotes = {}
-        self.hist_quotes = {i:DataFrame() for i in self.watchlist}
+        self._quote_capacity = quote_capacity
+        self._spill_quotes = spill_quotes
+        self.hist_quotes: Dict[str, QuoteRing] = {i: self._quote_ring(i) for i in self.watchlist}
+        # minute bars built from the stream, published to listeners as "bar" events
+        self.bar_aggregator = BarAggregator(self._on_bar, grace=int(bar_grace * 1e9))
+        self.latest_bars: Dict[str, Bar] = {}
+        self._bar_lock = Lock()
+        self._stop_flag = Event()
+        self.bar_cache = BarCache(self._bars_dir, self._fetch_bars, max_workers=max_download_workers)
+        # account, positions and open orders maintained from trade updates, reconciled by REST
+        self.broker_state = BrokerState()
+        self._reconcile_interval = reconcile_interval
+
+    def _quote_ring(self, symbol: str) -> QuoteRing:
+        spill_path = os.path.join(self._quotes_dir, f"{symbol}.bin") if self._spill_quotes else None
+        return QuoteRing(self._quote_capacity, spill_path)
 
     ## Streaming methods ##
     def beginStream(self):
         Stream.subscribe_quotes(self, self.quote_callback, *tuple(self.watchlist))
+        Stream.subscribe_trades(self, self.trade_callback, *tuple(self.watchlist))
         Stream.subscribe_trade_updates(self, self._on_trade_update)
+        self._stop_flag.clear()
+        self.reconcile()
+        Thread(target=self._flush_bars, name="AlpacaBarFlush", daemon=True).start()
+        Thread(target=self._reconcile_loop, name="AlpacaReconcile", daemon=True).start()
         Stream.run(self)
     
     def endStream(self):
+        self._stop_flag.set()
         Stream.unsubscribe_trades(self)
         Stream.unsubscribe_quotes(self)
         Stream.stop(self)
 
     async def _on_trade_update(self, trade):
-        print(trade)
+        self.broker_state.apply_trade_update(trade)
+        order = trade.order if isinstance(trade.order, dict) else trade.order._raw
+        self._notify("trade_update", order.get("symbol"), trade)
     
     async def quote_callback(self, quote: Quote):
         self.latest_quotes[quote.symbol] = quote
-        if quote.symbol not in self.hist_quotes:
-            self.hist_quotes[quote.symbol] = DataFrame()
-        self.hist_quotes[quote.symbol] = self.hist_quotes[quote.symbol].append(quote._raw)
+        ring = self.hist_quotes.get(quote.symbol)
+        if ring is None:
+            ring = self.hist_quotes[quote.symbol] = self._quote_ring(quote.symbol)
+        raw = quote._raw
+        timestamp = pd.Timestamp(raw["timestamp"]).value
+        ring.append(timestamp, raw["bid_price"], raw["ask_price"], raw["bid_size"], raw["ask_size"])
+        with self._bar_lock:
+            self.bar_aggregator.add_quote(quote.symbol, timestamp, raw["bid_price"], raw["ask_price"])
+
+    async def trade_callback(self, trade):
+        raw = trade._raw
+        with self._bar_lock:
+            self.bar_aggregator.add_trade(trade.symbol, pd.Timestamp(raw["timestamp"]).value, raw["price"], raw["size"])
+
+    def _on_bar(self, bar: Bar):
+        self.latest_bars[bar.symbol] = bar
+        self._notify("bar", bar.symbol, bar)
+
+    def _flush_bars(self):
+        # closes the bars of symbols which stopped ticking, shortly after each minute ends
+        while not self._stop_flag.wait(1.0):
+            with self._bar_lock:
+                self.bar_aggregator.flush(time.time_ns())
+
+    ## Broker state ##
+    def reconcile(self, attempts: int = 3):
+        """Replaces the cached account, positions and open orders with REST snapshots.
+
+        Snapshots overtaken by trade updates while they were fetched are refetched, up to `attempts` times.
+        """
+        try:
+            for _ in range(attempts):
+                since = self.broker_state.updates
+                if self.broker_state.reconcile(REST.get_account(self), REST.list_positions(self),
+                                               REST.list_orders(self, status="open"), since=since):
+                    return
+            logging.info("Alpaca broker state reconciliation skipped, trade updates kept arriving during the fetch")
+        except Exception as e:
+            logging.error(f"Alpaca broker state reconciliation failed: {e}")
+
+    def _reconcile_loop(self):
+        while not self._stop_flag.wait(self._reconcile_interval):
+            self.reconcile()
+
+    def getAccount(self):
+        """Cached account of the last reconciliation, None before the first one."""
+        return self.broker_state.account()
+
+    def getPosition(self, symbol: str) -> PositionState:
+        """Cached position in `symbol`, None when flat."""
+        return self.broker_state.position(symbol)
+
+    def getOpenOrders(self, symbol: str = None) -> list:
+        return self.broker_state.open_orders(symbol)
+
+    ## Historical data ##
+    def _fetch_bars(self, symbol: str, timeframe: str, start: dt.datetime, end: dt.datetime) -> pd.DataFrame:
+        return REST.get_bars(self, symbol, timeframe, self._fmt_date(start), self._fmt_date(end)).df
+
+    def getBars(self, symbols: list, timeframe: str, start, end=None) -> pd.DataFrame:
+        """Returns historical bars of `symbols`, served from the local cache and downloading only missing days.
+
+        Keyword arguments:
+        symbols -- symbols to load
+        timeframe -- bar timeframe, e.g. "1Min"
+        start -- start of the range (naive values are UTC)
+        end -- end of the range (default None, now)
+        Return: pandas.DataFrame with timestamp, open, high, low, close, volume, trade_count, vwap and symbol columns
+        """
+        return self.bar_cache.load(symbols, timeframe, start, end)
 
     ## General methods ##
     @staticmethod
@@ -0,0 +1,133 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+BAR_COLUMNS = {"timestamp": np.int64, "open": np.float64, "high": np.float64, "low": np.float64,
+               "close": np.float64, "volume": np.float64, "trade_count": np.float64, "vwap": np.float64}
+
+
+class BarCache:
+    """Local store of historical bars, one compressed NumPy file per (symbol, timeframe, UTC day).
+
+    `load` returns the bars of a date range, downloading only the days missing from the cache. Missing
+    days are grouped into contiguous ranges of at most `chunk_days`, fetched in parallel by up to
+    `max_workers` threads. A day is only written once it ended more than `data_delay` ago, so every
+    bar of it is published; empty weekend days are written so they are not requested again, but an
+    empty weekday is not, since it is more likely a failed or early fetch than a holiday.
+
+    Keyword arguments:
+    directory -- root directory of the cache
+    fetch -- downloads the bars of one symbol, fetch(symbol, timeframe, start, end) -> DataFrame indexed by timestamp
+    max_workers -- maximum number of concurrent downloads (default 8)
+    chunk_days -- maximum number of days covered by one download (default 5)
+    data_delay -- delay after which the bars of a day are complete at the data provider (default 30 minutes)
+    """
+
+    def __init__(self, directory: str, fetch: Callable[[str, str, datetime, datetime], pd.DataFrame],
+                 max_workers: int = 8, chunk_days: int = 5, data_delay: timedelta = timedelta(minutes=30)):
+        self.directory = directory
+        self._fetch = fetch
+        self._max_workers = max_workers
+        self._chunk_days = chunk_days
+        self._data_delay = data_delay
+
+    def path(self, symbol: str, timeframe: str, day: date) -> str:
+        return os.path.join(self.directory, timeframe, symbol, f"{day:%Y%m%d}.npz")
+
+    def _read(self, symbol: str, timeframe: str, day: date) -> Dict[str, np.ndarray]:
+        with np.load(self.path(symbol, timeframe, day)) as data:
+            return {name: data[name] for name in BAR_COLUMNS}
+
+    def _write(self, symbol: str, timeframe: str, day: date, columns: Dict[str, np.ndarray]):
+        path = self.path(symbol, timeframe, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written under a temporary name first so an interrupted download never leaves a partial day
+        tmp = path[:-len(".npz")] + ".tmp.npz"
+        np.savez_compressed(tmp, **columns)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        columns = {"timestamp": pd.DatetimeIndex(df.index).tz_convert("UTC").asi8 if len(df) else np.empty(0, np.int64)}
+        for name, dtype in BAR_COLUMNS.items():
+            if name != "timestamp":
+                columns[name] = df[name].to_numpy(dtype) if name in df else np.full(len(df), np.nan)
+        return columns
+
+    def _is_final(self, day: date, now: datetime) -> bool:
+        """True once the bars of `day` can no longer change."""
+        return datetime.combine(day + timedelta(1), datetime.min.time(), timezone.utc) + self._data_delay <= now
+
+    def _missing_ranges(self, symbol: str, timeframe: str, days: List[date]) -> List[Tuple[date, date]]:
+        """Groups the days to download into contiguous chunks of at most `chunk_days` days."""
+        ranges: List[Tuple[date, date]] = []
+        for day in days:
+            if os.path.exists(self.path(symbol, timeframe, day)):
+                continue
+            if ranges and ranges[-1][1] == day - timedelta(1) and (day - ranges[-1][0]).days < self._chunk_days:
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    def _download(self, symbol: str, timeframe: str, first: date, last: date, now: datetime) -> Dict[date, Dict[str, np.ndarray]]:
+        start = datetime.combine(first, datetime.min.time(), timezone.utc)
+        end = datetime.combine(last + timedelta(1), datetime.min.time(), timezone.utc)
+        columns = self._columns(self._fetch(symbol, timeframe, start, end))
+        day_of = columns["timestamp"].astype("datetime64[ns]").astype("datetime64[D]")
+        fetched = {}
+        n_days = (last - first).days + 1
+        for day in (first + timedelta(i) for i in range(n_days)):
+            mask = day_of == np.datetime64(day, "D")
+            fetched[day] = {name: values[mask] for name, values in columns.items()}
+            if self._is_final(day, now) and (len(fetched[day]["timestamp"]) or day.weekday() >= 5):
+                self._write(symbol, timeframe, day, fetched[day])
+        return fetched
+
+    def load(self, symbols: Sequence[str], timeframe: str, start, end) -> pd.DataFrame:
+        """Returns the bars of `symbols` with start <= timestamp < end, in the layout of REST.get_bars(...).df.reset_index().
+
+        Keyword arguments:
+        symbols -- symbols to load
+        timeframe -- bar timeframe understood by the API, e.g. "1Min"
+        start -- start of the range, anything accepted by pandas.Timestamp (naive values are UTC)
+        end -- end of the range, None for now
+        Return: pandas.DataFrame with a timestamp column (UTC) and a symbol column
+        """
+        start = pd.Timestamp(start)
+        end = pd.Timestamp.now(tz="UTC") if end is None else pd.Timestamp(end)
+        start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+        end = end.tz_localize("UTC") if end.tzinfo is None else end.tz_convert("UTC")
+        now = datetime.now(timezone.utc)
+        days = [day.date() for day in pd.date_range(start.normalize(), end.normalize(), freq="D")]
+
+        per_symbol: Dict[str, Dict[date, Dict[str, np.ndarray]]] = {symbol: {} for symbol in symbols}
+        jobs = [(symbol, first, last) for symbol in symbols
+                for first, last in self._missing_ranges(symbol, timeframe, days)]
+        if jobs:
+            logging.debug(f"Downloading {len(jobs)} chunks of {timeframe} bars for {len(symbols)} symbols")
+            with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+                futures = [(symbol, pool.submit(self._download, symbol, timeframe, first, last, now))
+                           for symbol, first, last in jobs]
+                for symbol, future in futures:
+                    per_symbol[symbol].update(future.result())
+
+        frames = []
+        for symbol in symbols:
+            chunks = [per_symbol[symbol][day] if day in per_symbol[symbol] else self._read(symbol, timeframe, day)
+                      for day in days]
+            columns = {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype)
+                       for name, dtype in BAR_COLUMNS.items()}
+            mask = (columns["timestamp"] >= start.value) & (columns["timestamp"] < end.value)
+            df = pd.DataFrame({name: values[mask] for name, values in columns.items()})
+            df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+            df["symbol"] = symbol
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=list(BAR_COLUMNS) + ["symbol"])
+        return pd.concat(frames, ignore_index=True)
@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from typing import Callable
 from utils import init_logging
 import logging
 
+GatewayEvent = namedtuple("GatewayEvent", ["source", "kind", "key", "data"])
+
 class OrderTypeNotSupportedError(Exception):
     def __init__(self, gateway, order):
         self.gateway = gateway
@@ -28,6 +32,28 @@ class Gateway(ABC):
     @abstractmethod
     def endStream(self):
         raise NotImplementedError()
+
+    def addListener(self, callback: Callable[[GatewayEvent], None]):
+        """Registers a callback invoked for every event the gateway publishes.
+
+        Callbacks run synchronously on whichever thread publishes the event: the engine loop for
+        asyncio gateways, but a stream, flush or reconcile thread for others (e.g. AlpacaGateway).
+        They must be quick and thread safe, and hand work to a loop through a LoopBridge if needed.
+        """
+        self.__dict__.setdefault("_listeners", []).append(callback)
+
+    def removeListener(self, callback: Callable[[GatewayEvent], None]):
+        listeners = self.__dict__.get("_listeners", [])
+        if callback in listeners:
+            listeners.remove(callback)
+
+    def _notify(self, kind: str, key=None, data=None):
+        event = GatewayEvent(self.NAME, kind, key, data)
+        for callback in self.__dict__.get("_listeners", ()):
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Listener {callback} failed on {kind} event from {self.NAME}: {e}")
     
 
 
@@ -0,0 +1,111 @@
+import logging
+import time
+from collections import namedtuple
+from threading import Lock
+from typing import Dict, Iterable, List
+
+PositionState = namedtuple("PositionState", ["symbol", "qty", "avg_entry_price"])
+
+_OPEN_EVENTS = ("new", "pending_new", "accepted", "partial_fill", "pending_cancel", "pending_replace")
+_CLOSED_EVENTS = ("fill", "canceled", "expired", "rejected", "done_for_day", "replaced", "stopped", "suspended")
+
+
+def _field(obj, name, default=None):
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+class BrokerState:
+    """In-memory account, positions and open orders of a broker account, read in O(1).
+
+    Kept current from the trade update stream (`apply_trade_update`) and replaced wholesale by
+    `reconcile` with REST snapshots, which also repairs anything the stream missed while it was
+    disconnected. A snapshot fetched while stream updates were being applied may predate them,
+    so `reconcile` takes the `updates` count read before fetching and discards the snapshot when
+    it changed, instead of wiping out fills the snapshot does not include.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._account = None
+        self._positions: Dict[str, PositionState] = {}
+        self._orders: Dict[str, dict] = {}
+        self.last_reconciled: float = None
+        self.updates = 0
+
+    def account(self):
+        return self._account
+
+    def position(self, symbol: str) -> PositionState:
+        """Returns the open position in `symbol`, None when flat."""
+        return self._positions.get(symbol)
+
+    def positions(self) -> Dict[str, PositionState]:
+        return dict(self._positions)
+
+    def open_orders(self, symbol: str = None) -> List[dict]:
+        orders = list(self._orders.values())
+        return orders if symbol is None else [order for order in orders if order.get("symbol") == symbol]
+
+    def reconcile(self, account, positions: Iterable, orders: Iterable, since: int = None) -> bool:
+        """Replaces the cached state with REST snapshots (account, list_positions(), list_orders(status="open")).
+
+        Keyword arguments:
+        since -- value of `updates` read before fetching the snapshots, None to apply them unconditionally
+        Return: False when stream updates arrived since `since` and the snapshots were discarded
+        """
+        cached = {}
+        for position in positions:
+            symbol = _field(position, "symbol")
+            cached[symbol] = PositionState(symbol, float(_field(position, "qty")), float(_field(position, "avg_entry_price")))
+        open_orders = {}
+        for order in orders:
+            order = order._raw if hasattr(order, "_raw") else dict(order)
+            open_orders[order["id"]] = order
+        with self._lock:
+            if since is not None and self.updates != since:
+                return False
+            self._account = account
+            if cached != self._positions:
+                logging.info(f"Broker positions reconciled: {sorted(cached)}")
+            self._positions = cached
+            self._orders = open_orders
+            self.last_reconciled = time.time()
+        return True
+
+    def apply_trade_update(self, update):
+        """Applies one trade update event (new, fill, partial_fill, canceled...) to orders and positions."""
+        event = _field(update, "event")
+        order = _field(update, "order") or {}
+        order = order._raw if hasattr(order, "_raw") else order
+        symbol = order.get("symbol")
+        with self._lock:
+            self.updates += 1
+            if event in _OPEN_EVENTS:
+                self._orders[order["id"]] = order
+            elif event in _CLOSED_EVENTS:
+                self._orders.pop(order.get("id"), None)
+            if event in ("fill", "partial_fill") and symbol is not None:
+                self._apply_fill(symbol, update, order)
+
+    def _apply_fill(self, symbol: str, update, order: dict):
+        position_qty = _field(update, "position_qty")
+        price = float(_field(update, "price") or order.get("filled_avg_price") or 0)
+        fill_qty = float(_field(update, "qty") or 0)
+        previous = self._positions.get(symbol)
+        old_qty = previous.qty if previous else 0.0
+        if position_qty is not None:
+            qty = float(position_qty)
+        else:
+            qty = old_qty + (fill_qty if order.get("side") == "buy" else -fill_qty)
+        if qty == 0:
+            self._positions.pop(symbol, None)
+            return
+        if previous is None or old_qty * qty < 0:
+            avg_entry_price = price
+        elif abs(qty) > abs(old_qty):
+            avg_entry_price = (abs(old_qty) * previous.avg_entry_price + (abs(qty) - abs(old_qty)) * price) / abs(qty)
+        else:
+            avg_entry_price = previous.avg_entry_price
+        self._positions[symbol] = PositionState(symbol, qty, avg_entry_price)
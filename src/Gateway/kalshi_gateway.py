@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from threading import Thread, Event
 import websockets
 import logging
-import requests as r
+import asyncio
 
 from typing import List, Dict
 from enum import Enum
@@ -19,16 +19,21 @@ from cryptography.hazmat.primitives import serialization
 from cryptography.exceptions import InvalidSignature
 
 from .base_gateway import Gateway
+from .market_catalog import MarketCatalog
+from .rest_client import AsyncRestClient
+from .sharding import ShardedStream, StreamShard
+from trading.order_book import TickBook
 
 class Environment(Enum):
     DEMO = "demo"
     PROD = "prod"
 
-class KalshiGateway(Gateway):
+class KalshiGateway(ShardedStream, Gateway):
     NAME = "KalshiGateway"
+    _PRICE_TICKS = 100
     dotenv.load_dotenv(".config/.env")
 
-    def __init__(self, subscribed_markets: List[str], environment: str = "demo"):
+    def __init__(self, subscribed_markets: List[str], environment: str = "demo", max_markets_per_connection: int = 100):
         websockets_logger = logging.getLogger('websockets')
         websockets_logger.setLevel(logging.INFO)
         logging.debug(f"environment: {environment}")
@@ -38,24 +43,21 @@ class KalshiGateway(Gateway):
         self._api_key = self.load_private_key_from_file(self._api_key_filepath)
         self._rest_host = "https://api.elections.kalshi.com" if environment == Environment.PROD else "https://demo-api.kalshi.co"
         self._stream_host = "wss://api.elections.kalshi.com" if environment == Environment.PROD else "wss://demo-api.kalshi.co"
-        self._markets_dir = "data/kalshi_markets.json"
-
-        self.markets = None
-        self.markets_last_updated = datetime.min
-        if os.path.isfile(self._markets_dir):
-            with open(self._markets_dir, "r") as markets_file:
-                try:
-                    markets_dict = json.load(markets_file)
-                    self.markets = markets_dict["markets"]
-                    self.markets_last_updated = markets_dict["last_update"]
-                except:
-                    logging.error(f"Error reading markets file stored at {self._markets_dir}")
-        else:
-            logging.debug(f"File {self._markets_dir} does not exist.")
 
-        self.subscribed_markets = subscribed_markets
+        self.catalog = MarketCatalog(self._DB_PATH, "kalshi_markets",
+                                     key=lambda market: market["ticker"],
+                                     event=lambda market: market.get("event_ticker"),
+                                     close_time=lambda market: market.get("close_time"))
+        self._markets = None
+        self.markets_last_updated = self.catalog.last_update()
+
+        self._init_shards(subscribed_markets, max_markets_per_connection)
         self.market_msgs: Dict[str, List] = {id: [] for id in self.subscribed_markets}
         self.msg_id = 1
+        self._rest = AsyncRestClient(self._rest_host, headers=self.__header)
+
+        self.books: Dict[str, TickBook] = {}
+        self._stale_books = set()
 
     def __header(self, method, path):
         current_time_milliseconds = int(time.time() * 1000)
@@ -96,50 +98,55 @@ class KalshiGateway(Gateway):
         except InvalidSignature as e:
             raise ValueError("RSA sign PSS failed") from e
         
-    def __get(self, endpoint, params, headers = None, ret_type="json"):
-        path = KalshiGateway._rest_host + endpoint
-        if headers is None:
-            headers = self.__header("GET", path)
-        resp = r.get(path, params=params, headers=headers)
-        if ret_type == "json":
-            return resp.json()
-        else:
-            return resp
-
-    def _download_markets(self, obj_vector, evt: Event):
-        # download from polymarket
-        next_cursor = ""
-        params = {
-            'status': ['open'],
-            'limit': 1000
-        }
-        while True:
-            resp = self.__get("/trade-api/v2/markets", params)
-            obj_vector += resp['markets']
-            next_cursor = resp['cursor']
-            logging.debug(f"Fetched markets, received next cursor {next_cursor}")
-            if resp['cursor'] == "":
-                break
-        # set event flag to false
-        evt.set()
-        # save to class & file
-        self.markets = obj_vector
-        with open(self._markets_dir, "w") as markets_file:
-            try:
-                obj_dict = {"last_update": datetime.now().strftime("%d/%m/%Y, %H:%M:%S"), "markets": obj_vector}
-                json.dump(obj_dict, markets_file, indent=4)
-            except Exception as e:
-                logging.error(f"Error reading markets file stored at {self._markets_dir}:\n{e}")
+    async def _download_markets(self, obj_vector, evt: Event, statuses=("open",)):
+        # each status is an independent cursor chain, so the chains are walked concurrently over the pool
+        async def on_page(page):
+            obj_vector.extend(page)
+
+        try:
+            await asyncio.gather(*(
+                self._rest.paginate("/trade-api/v2/markets", {"status": status, "limit": 1000}, "markets", on_page)
+                for status in statuses
+            ))
+            # save to class & catalog, only markets which changed are written and markets no longer open expire
+            self.markets = obj_vector
+            self.markets_last_updated = datetime.now()
+            await asyncio.to_thread(self.catalog.upsert, obj_vector, self.markets_last_updated, statuses == ("open",))
+        except Exception as e:
+            logging.error(f"Error downloading Kalshi markets: {e}")
+        finally:
+            # set event flag to false
+            evt.set()
+
+    async def _download_markets_standalone(self, obj_vector, evt: Event):
+        # the pooled session is bound to the temporary loop of the calling thread, release it with the loop
+        try:
+            await self._download_markets(obj_vector, evt)
+        finally:
+            await self._rest.close()
+
+    @property
+    def markets(self):
+        # decoded from the catalog on first access only
+        if self._markets is None and len(self.catalog):
+            self._markets = self.catalog.all()
+        return self._markets
+
+    @markets.setter
+    def markets(self, markets):
+        self._markets = markets
 
     def getMarkets(self, download):
-        if (download or self.markets is None) or \
+        if (download or len(self.catalog) == 0) or \
            (download is None and self.markets_last_updated < datetime.now() - timedelta(1)):
             logging.info("Downloading markets data")
             evt = Event()
             markets = []
             evt.clear()
-            t = Thread(target=self._download_markets, args=(markets, evt))
-            t.start()
+            if self._loop is not None and self._loop.is_running():
+                asyncio.run_coroutine_threadsafe(self._download_markets(markets, evt), self._loop)
+            else:
+                Thread(target=asyncio.run, args=(self._download_markets_standalone(markets, evt),)).start()
             # returns an Event object for market download & the datastructure itself
             return (evt, markets)
 
@@ -155,67 +162,143 @@ class KalshiGateway(Gateway):
         except KeyboardInterrupt:
             self.__market_th.join()
     
-    async def __stream_market_on_open(self, ws: websockets.WebSocketClientProtocol):
-        logging.debug("Kalshi stream connection opened")
-        await ws.send(json.dumps(self.market_subscription_message))
+    def __subscribe_message(self, shard: StreamShard, ticker: str) -> dict:
+        message = {
+            "id": self.msg_id,
+            "cmd": "subscribe",
+            "params": {
+                'channels': ['orderbook_delta'],
+                'market_tickers': [ticker]
+            }
+        }
+        shard.state["pending"][self.msg_id] = ticker
         self.msg_id += 1
+        return message
+
+    async def __stream_market_on_open(self, shard: StreamShard, ws: websockets.WebSocketClientProtocol):
+        logging.debug(f"Kalshi stream connection {shard.index} opened")
+        shard.ws = ws
+        # subscription ids and sequence numbers are scoped to a connection
+        shard.state.update(sids={}, last_seq={}, pending={}, cancelled=set())
+        await self._send_subscribe(shard, list(shard.markets))
 
-    async def __stream_market_on_message(self, message):
+    async def _send_subscribe(self, shard: StreamShard, markets: List[str]):
+        # one subscription per market gives each market its own sid, so a sequence gap
+        # can be traced back to (and repaired for) a single market
+        for ticker in markets:
+            self._stale_books.add(ticker)
+            await shard.ws.send(json.dumps(self.__subscribe_message(shard, ticker)))
+
+    async def _send_unsubscribe(self, shard: StreamShard, markets: List[str]):
+        markets = set(markets)
+        sids = [sid for sid, ticker in shard.state["sids"].items() if ticker in markets]
+        for sid in sids:
+            shard.state["sids"].pop(sid)
+            shard.state["last_seq"].pop(sid, None)
+        # subscriptions not acknowledged yet are unsubscribed as soon as their sid arrives
+        shard.state["cancelled"].update(msg_id for msg_id, ticker in shard.state["pending"].items() if ticker in markets)
+        for ticker in markets:
+            self.books.pop(ticker, None)
+            self._stale_books.discard(ticker)
+        if sids:
+            await shard.ws.send(json.dumps({"id": self.msg_id, "cmd": "unsubscribe", "params": {"sids": sids}}))
+            self.msg_id += 1
+
+    async def __resnapshot(self, shard: StreamShard, sid: int, ticker: str):
+        logging.warning(f"Sequence gap on {ticker} (sid {sid}), requesting a new snapshot")
+        self._stale_books.add(ticker)
+        shard.state["sids"].pop(sid, None)
+        shard.state["last_seq"].pop(sid, None)
+        await shard.ws.send(json.dumps({"id": self.msg_id, "cmd": "unsubscribe", "params": {"sids": [sid]}}))
+        self.msg_id += 1
+        await shard.ws.send(json.dumps(self.__subscribe_message(shard, ticker)))
+
+    def __on_orderbook_snapshot(self, shard: StreamShard, sid: int, seq: int, msg: dict):
+        ticker = msg["market_ticker"]
+        if sid not in shard.state["sids"]:
+            # snapshot of a subscription dropped in the meantime
+            return
+        book = self.books.get(ticker)
+        if book is None:
+            book = self.books[ticker] = TickBook(self._PRICE_TICKS)
+        # a NO bid at p cents is a YES ask at 100 - p cents
+        book.load(msg.get("yes") or (), ((self._PRICE_TICKS - price, size) for price, size in msg.get("no") or ()))
+        shard.state["last_seq"][sid] = seq
+        self._stale_books.discard(ticker)
+        self._notify("book", ticker, book)
+
+    async def __on_orderbook_delta(self, shard: StreamShard, sid: int, seq: int, msg: dict):
+        ticker = msg["market_ticker"]
+        if ticker in self._stale_books or sid not in shard.state["sids"]:
+            return
+        last_seq = shard.state["last_seq"].get(sid)
+        if last_seq is None or seq != last_seq + 1:
+            await self.__resnapshot(shard, sid, ticker)
+            return
+        shard.state["last_seq"][sid] = seq
+        book = self.books[ticker]
+        if msg["side"] == "yes":
+            book.add_level(True, msg["price"], msg["delta"])
+        else:
+            book.add_level(False, self._PRICE_TICKS - msg["price"], msg["delta"])
+        self._notify("book", ticker, book)
+
+    async def __stream_market_on_message(self, shard: StreamShard, message):
         try:
-            logging.debug(json.dumps(message))
+            resp = json.loads(message)
+            msg_type = resp.get("type")
+            if msg_type == "orderbook_delta":
+                await self.__on_orderbook_delta(shard, resp["sid"], resp["seq"], resp["msg"])
+            elif msg_type == "orderbook_snapshot":
+                self.__on_orderbook_snapshot(shard, resp["sid"], resp["seq"], resp["msg"])
+            elif msg_type == "subscribed":
+                msg_id = resp.get("id")
+                ticker = shard.state["pending"].pop(msg_id, None)
+                if msg_id in shard.state["cancelled"]:
+                    shard.state["cancelled"].discard(msg_id)
+                    await shard.ws.send(json.dumps({"id": self.msg_id, "cmd": "unsubscribe", "params": {"sids": [resp["msg"]["sid"]]}}))
+                    self.msg_id += 1
+                elif ticker is not None:
+                    shard.state["sids"][resp["msg"]["sid"]] = ticker
+            elif msg_type == "error":
+                shard.state["pending"].pop(resp.get("id"), None)
+                shard.state["cancelled"].discard(resp.get("id"))
+                logging.error(f"Kalshi stream error: {resp.get('msg')}")
         except Exception as e:
             logging.error(f"Error in stream market on message: {e}")
 
+    def getBook(self, ticker: str) -> TickBook:
+        """Returns the live book of `ticker` (prices in cents, asks derived from NO bids), None if not yet received."""
+        return self.books.get(ticker)
+
     async def __stream_market_on_error(self, error):
         logging.error(f"Error was sent:\n{error}")
 
-    async def __stream_market_on_close(self, close_status_code, close_msg):
-        logging.info(f"WebSocket closed: {close_status_code}, {close_msg}. Reconnecting...")
-        # ensure ping thread is stopped
-        self.ping_task.cancel()
-
-        self.last_retry = getattr(self, "last_retry", datetime.min)
-
-        # if last retry was more than 1h ago, restart retry counter
-        if (datetime.now() - self.last_retry).seconds/60/60 > 1:
-            self.retry_count = 1
-        else:
-            self.retry_count = getattr(self, "retry_count", 0) + 1
-        self.last_retry = datetime.now()
+    async def __stream_market_on_close(self, shard: StreamShard, close_status_code, close_msg):
+        logging.info(f"WebSocket {shard.index} closed: {close_status_code}, {close_msg}. Reconnecting...")
+        shard.ws = None
+        # books cannot be trusted until the snapshots of the next session arrive
+        self._stale_books.update(shard.markets)
 
-        # if more than 10 retries within last hour, stop trying to connect
-        if self.retry_count > 10:
-            logging.error("Did not manage to re-establish connection with Polymarket socket API.")
-        # try to connect otherwise, using exponential wait times
-        else:
-            time.sleep(min(2**(self.retry_count), 60))
-            await self.__stream_market()
-
-    async def __stream_market(self):
+    async def _stream_shard(self, shard: StreamShard):
+        headers = self.__header("GET", "/trade-api/ws/v2")
+        url_suffix = "/trade-api/ws/v2"
         try:
-            headers = self.__header("GET", "/trade-api/ws/v2")
-            url_suffix = "/trade-api/ws/v2"
-            self.market_subscription_message = {
-                "id": self.msg_id,
-                "cmd": "subscribe",
-                "params": {
-                    'channels': ['orderbook_delta'],
-                    'market_tickers': self.subscribed_markets
-                }
-            }
             async with websockets.connect(f"{self._stream_host}{url_suffix}", additional_headers=headers) as ws:
-                await self.__stream_market_on_open(ws)
+                await self.__stream_market_on_open(shard, ws)
+                shard.supervisor.connected()
                 async for message in ws:
-                    await self.__stream_market_on_message(message)
+                    await self.__stream_market_on_message(shard, message)
+            await self.__stream_market_on_close(shard, ws.close_code, ws.close_reason)
         except websockets.ConnectionClosed as e:
-            logging.error(f"WebSocket connection closed: {e.code}, {e.reason}")
-            await self.__stream_market_on_close(e.code, e.reason)
+            await self.__stream_market_on_close(shard, e.code, e.reason)
         except Exception as e:
-            logging.error(f"WebSocket error: {e}")
             await self.__stream_market_on_error(e)
+            await self.__stream_market_on_close(shard, None, str(e))
 
     async def beginStream(self):
-        await self.__stream_market()
+        await self._run_shards()
 
-    def endStream(self):
-        pass
\ No newline at end of file
+    async def endStream(self):
+        await self._close_shards()
+        await self._rest.close()
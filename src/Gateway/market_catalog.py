@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+
+_TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+class MarketCatalog:
+    """SQLite-backed market universe of a venue, stored in the gateway database.
+
+    Each market is kept as its raw JSON next to indexed columns (id, event, close time) and a
+    digest of its content, so refreshes only rewrite markets which actually changed and
+    lookups only decode the rows they return.
+
+    Keyword arguments:
+    db_path -- path of the SQLite database
+    table -- table holding this venue's markets
+    key -- extracts the unique id of a market (ticker, condition id...)
+    event -- extracts the event a market belongs to
+    close_time -- extracts the ISO 8601 close time of a market
+    updated_at -- extracts the venue's last modification stamp of a market, if any (default None)
+    """
+
+    def __init__(self, db_path: str, table: str, key: Callable[[dict], str], event: Callable[[dict], str],
+                 close_time: Callable[[dict], str], updated_at: Callable[[dict], str] = None):
+        self._db_path = db_path
+        self._table = table
+        self._key = key
+        self._event = event
+        self._close_time = close_time
+        self._updated_at = updated_at or (lambda market: None)
+        self._lock = Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        dirname = os.path.dirname(self._db_path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        conn = sqlite3.connect(self._db_path)
+        if not self._initialized:
+            conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {self._table} (
+                    id TEXT PRIMARY KEY,
+                    event TEXT,
+                    close_time TEXT,
+                    updated_at TEXT,
+                    digest TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS {self._table}_event ON {self._table} (event);
+                CREATE INDEX IF NOT EXISTS {self._table}_close_time ON {self._table} (close_time);
+                CREATE TABLE IF NOT EXISTS market_catalogs (name TEXT PRIMARY KEY, last_update TEXT);
+            """)
+            self._initialized = True
+        return conn
+
+    @staticmethod
+    def _digest(data: str) -> str:
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+    def upsert(self, markets: Iterable[dict], last_update: datetime = None, full: bool = False) -> int:
+        """Inserts new markets and rewrites changed ones, leaving identical rows untouched.
+
+        Keyword arguments:
+        markets -- markets downloaded from the venue
+        last_update -- time of the refresh, recorded for `last_update()` (default None)
+        full -- `markets` is the venue's complete list of open markets, stored markets missing from it
+        have closed or settled and are deleted (default False)
+        Return: number of markets written
+        """
+        with self._lock, closing(self._connect()) as conn:
+            digests = dict(conn.execute(f"SELECT id, digest FROM {self._table}"))
+            seen = set()
+            rows = []
+            for market in markets:
+                data = json.dumps(market, sort_keys=True, separators=(",", ":"))
+                digest = self._digest(data)
+                key = self._key(market)
+                seen.add(key)
+                if digests.get(key) == digest:
+                    continue
+                digests[key] = digest
+                rows.append((key, self._event(market), self._close_time(market), self._updated_at(market), digest, data))
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO {self._table} (id, event, close_time, updated_at, digest, data) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET event = excluded.event, close_time = excluded.close_time, "
+                    "updated_at = excluded.updated_at, digest = excluded.digest, data = excluded.data",
+                    rows)
+                expired = [(key,) for key in digests if key not in seen] if full else []
+                conn.executemany(f"DELETE FROM {self._table} WHERE id = ?", expired)
+                if last_update is not None:
+                    conn.execute("INSERT OR REPLACE INTO market_catalogs (name, last_update) VALUES (?, ?)",
+                                 (self._table, last_update.strftime(_TIME_FMT)))
+        logging.debug(f"{len(rows)} markets changed and {len(expired)} expired in {self._table}")
+        return len(rows)
+
+    def remove(self, keys: Iterable[str]) -> int:
+        """Deletes markets the venue reports as closed or settled.
+
+        Return: number of markets deleted
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            return conn.executemany(f"DELETE FROM {self._table} WHERE id = ?", [(key,) for key in keys]).rowcount
+
+    def last_update(self) -> datetime:
+        if not os.path.exists(self._db_path):
+            return datetime.min
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT last_update FROM market_catalogs WHERE name = ?", (self._table,)).fetchone()
+        return datetime.strptime(row[0], _TIME_FMT) if row else datetime.min
+
+    def updated_at(self) -> Dict[str, str]:
+        """Returns the venue's modification stamp of every stored market, keyed by id."""
+        with self._lock, closing(self._connect()) as conn:
+            return dict(conn.execute(f"SELECT id, updated_at FROM {self._table}"))
+
+    def __len__(self):
+        if not os.path.exists(self._db_path):
+            return 0
+        with self._lock, closing(self._connect()) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def _select(self, where: str = "", params: tuple = ()) -> List[dict]:
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT data FROM {self._table} {where}", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, key: str) -> Optional[dict]:
+        markets = self._select("WHERE id = ?", (key,))
+        return markets[0] if markets else None
+
+    def by_event(self, event: str) -> List[dict]:
+        return self._select("WHERE event = ?", (event,))
+
+    def closing_between(self, start: str, end: str) -> List[dict]:
+        """Returns markets closing within [start, end), both given as ISO 8601 strings."""
+        return self._select("WHERE close_time >= ? AND close_time < ? ORDER BY close_time", (start, end))
+
+    def all(self) -> List[dict]:
+        return self._select()
@@ -0,0 +1,63 @@
+from trading.order_book import TickBook, price_to_ticks
+
+
+class PolymarketBooks:
+    """Mixin maintaining per-asset TickBooks from Polymarket market channel events.
+
+    Shared by the live PolymarketGateway and the ReplayGateway so recorded sessions go through
+    exactly the same book building path. Expects `self.books` and the Gateway `_notify` method.
+    """
+
+    # Polymarket tick sizes go down to 0.0001, coarser ticks are multiples of it
+    _PRICE_DECIMALS = 4
+
+    def _book(self, asset_id: str) -> TickBook:
+        book = self.books.get(asset_id)
+        if book is None:
+            book = self.books[asset_id] = TickBook(10 ** self._PRICE_DECIMALS)
+        return book
+
+    def _process_pm_book_msg(self, msg: dict):
+        decimals = self._PRICE_DECIMALS
+        book = self._book(msg["asset_id"])
+        book.load(((price_to_ticks(level["price"], decimals), float(level["size"])) for level in msg.get("bids") or msg.get("buys") or ()),
+                  ((price_to_ticks(level["price"], decimals), float(level["size"])) for level in msg.get("asks") or msg.get("sells") or ()))
+        self._notify("book", msg["asset_id"], book)
+
+    def _process_pm_price_change_msg(self, msg: dict):
+        changes = msg.get("price_changes")
+        if changes is None:
+            # older payloads carry one asset with its changes
+            self._apply_pm_price_changes(msg.get("changes", ()), msg["asset_id"])
+        else:
+            self._apply_pm_price_changes(changes)
+
+    def _apply_pm_price_changes(self, changes, asset_id: str = None):
+        """Applies price level changes, each naming its asset unless `asset_id` is given for all of them."""
+        decimals = self._PRICE_DECIMALS
+        touched = set()
+        for change in changes:
+            key = asset_id or change["asset_id"]
+            book = self.books.get(key)
+            if book is None:
+                # deltas are meaningless until the asset's book snapshot arrived
+                continue
+            book.set_level(change["side"] == "BUY", price_to_ticks(change["price"], decimals), float(change["size"]))
+            touched.add(key)
+        for key in touched:
+            self._notify("book", key, self.books[key])
+
+    def getBook(self, asset_id: str) -> TickBook:
+        """Returns the live book of `asset_id` in 10^-4 ticks (mid, microprice and depth are read without locking)."""
+        return self.books.get(asset_id)
+
+    def _process_pm_event(self, resp: dict) -> bool:
+        """Applies a market channel event to the books, returns False for events which are not book data."""
+        event_type = resp.get("event_type")
+        if event_type == "book":
+            self._process_pm_book_msg(resp)
+        elif event_type == "price_change":
+            self._process_pm_price_change_msg(resp)
+        else:
+            return False
+        return True
@@ -11,44 +11,43 @@ from threading import Lock, Thread, Event
 import websockets
 from websockets.exceptions import ConnectionClosed
 import asyncio
-import requests
 from typing import List, Dict
 import logging
 
 from .base_gateway import Gateway
-
-class PolymarketGateway(Gateway):
+from .market_catalog import MarketCatalog
+from .rest_client import AsyncRestClient
+from .sharding import ShardedStream, StreamShard
+from .tick_recorder import TickRecorder
+from .polymarket_books import PolymarketBooks
+from trading.order_book import TickBook
+
+class PolymarketGateway(ShardedStream, PolymarketBooks, Gateway):
     NAME = "PolymarketGateway"
     dotenv.load_dotenv(".config/.env")
     _api_key = os.environ["POLYMARKET_API_KEY"]
     _rest_host = "https://clob.polymarket.com"
     _gamma_host = "https://gamma-api.polymarket.com"
     _stream_host = "wss://ws-subscriptions-clob.polymarket.com"
-    _markets_dir = "data/polymarket_markets.json"
+    _ticks_dir = "data/polymarket_ws_markets"
     _chain_id = POLYGON
-    def __init__(self, subscribed_markets: List[str]):
+    def __init__(self, subscribed_markets: List[str], max_markets_per_connection: int = 200,
+                 record_ticks: bool = True, compress_ticks: bool = False):
         websockets_logger = logging.getLogger('websockets')
         websockets_logger.setLevel(logging.INFO) # Set websockets logger to INFO
-        self.markets = None
-        self.markets_last_updated = datetime.min
-        if os.path.isfile(self._markets_dir):
-            with open(self._markets_dir, "r") as markets_file:
-                try:
-                    markets_dict = json.load(markets_file)
-                    self.markets = markets_dict["markets"]
-                    self.markets_last_updated = markets_dict["last_update"]
-                except:
-                    logging.error(f"Error reading markets file stored at {self._markets_dir}")
-        else:
-            logging.debug(f"File {self._markets_dir} does not exist.")
-
-        self.subscribed_markets = subscribed_markets
+        self.catalog = MarketCatalog(self._DB_PATH, "polymarket_markets",
+                                     key=lambda market: market.get("conditionId") or str(market["id"]),
+                                     event=lambda market: (market.get("events") or [{}])[0].get("ticker"),
+                                     close_time=lambda market: market.get("endDate"),
+                                     updated_at=lambda market: market.get("updatedAt"))
+        self._markets = None
+        self.markets_last_updated = self.catalog.last_update()
+
+        self._init_shards(subscribed_markets, max_markets_per_connection)
         self.market_msgs: Dict[str, List] = {id: [] for id in self.subscribed_markets}
-
-    def _process_pm_book_msg(self, msg: dict):
-        bids = msg["bids"]
-        asks = msg['asks']
-        midpoint = (int(1000*float(asks[-1]["price"])) + int(1000*float(bids[-1]["price"])))/2
+        self.books: Dict[str, TickBook] = {}
+        self._gamma = AsyncRestClient(self._gamma_host)
+        self.recorder = TickRecorder(self._ticks_dir, compress=compress_ticks) if record_ticks else None
 
     def attachFeed(self, feed):
         self.feed = feed
@@ -73,129 +72,177 @@ class PolymarketGateway(Gateway):
             logging.error(f"Error in ping thread: {e}")
             raise e
 
-    async def __stream_market_on_open(self, ws: websockets.WebSocketClientProtocol):
-        await ws.send(json.dumps(self.market_subscription_message))
-        self.ping_task = asyncio.create_task(self.ping(ws)) 
+    async def __stream_market_on_open(self, shard: StreamShard, ws: websockets.WebSocketClientProtocol):
+        shard.ws = ws
+        await ws.send(json.dumps({
+            "auth": None,
+            "type": "market",
+            "assets_ids": list(shard.markets)
+        }))
+        shard.state["ping_task"] = asyncio.create_task(self.ping(ws))
+
+    async def _send_subscribe(self, shard: StreamShard, markets: List[str]):
+        await shard.ws.send(json.dumps({"assets_ids": markets, "operation": "subscribe"}))
+
+    async def _send_unsubscribe(self, shard: StreamShard, markets: List[str]):
+        await shard.ws.send(json.dumps({"assets_ids": markets, "operation": "unsubscribe"}))
 
     async def __stream_market_on_message(self, message):
         try:
             if (isinstance(message, list) and len(message) == 0) or (isinstance(message, str) and message == "PONG"):
                 return
             resp_l = json.loads(message)
+            if isinstance(resp_l, dict):
+                resp_l = [resp_l]
             for resp in resp_l:
-                if isinstance(resp, dict) and resp["event_type"] in ["book", "price_change"]:
-                    filename = f"data/polymarket_ws_markets/{resp['asset_id']}.log"
-                    if not os.path.exists(filename):
-                        open(filename, "x")
-                    with open(filename, "a") as f:
-                        f.write(json.dumps(resp) + "\n")
+                if isinstance(resp, dict) and self._process_pm_event(resp):
+                    if self.recorder is not None:
+                        self.recorder.record(resp.get("asset_id") or resp.get("market"), resp)
         except Exception as e:
             logging.error(f"Error in stream market on message: {e}")
             
     async def __stream_market_on_error(self, ws, error):
-        logging.error("Error was sent from the server")
+        logging.error(f"WebSocket error: {error}")
 
-    async def __stream_market_on_close(self, ws, close_status_code, close_msg):
-        logging.info(f"WebSocket closed: {close_status_code}, {close_msg}. Reconnecting...")
+    async def __stream_market_on_close(self, shard: StreamShard, close_status_code, close_msg):
+        logging.info(f"WebSocket {shard.index} closed: {close_status_code}, {close_msg}. Reconnecting...")
         # ensure ping thread is stopped
-        self.ping_task.cancel()
-
-        self.last_retry = getattr(self, "last_retry", datetime.min)
-
-        # if last retry was more than 1h ago, restart retry counter
-        if (datetime.now() - self.last_retry).seconds/60/60 > 1:
-            self.retry_count = 1
-        else:
-            self.retry_count = getattr(self, "retry_count", 0) + 1
-        self.last_retry = datetime.now()
-
-        # if more than 10 retries within last hour, stop trying to connect
-        if self.retry_count > 10:
-            logging.error("Did not manage to re-establish connection with Polymarket socket API.")
-        # try to connect otherwise, using exponential wait times
-        else:
-            time.sleep(min(2**(self.retry_count), 60))
-            await self.__stream_market()
+        ping_task = shard.state.pop("ping_task", None)
+        if ping_task is not None:
+            ping_task.cancel()
+        shard.ws = None
 
-    async def __stream_market(self):
+    async def _stream_shard(self, shard: StreamShard):
+        ws = None
         try:
-            self.market_subscription_message = {
-                "auth": None,
-                "type": "market",
-                "assets_ids": self.subscribed_markets
-            }
             async with websockets.connect(f"{self._stream_host}/ws/market") as ws:
-                await self.__stream_market_on_open(ws)
+                await self.__stream_market_on_open(shard, ws)
+                shard.supervisor.connected()
                 async for message in ws:
                     await self.__stream_market_on_message(message)
+            await self.__stream_market_on_close(shard, ws.close_code, ws.close_reason)
         except websockets.ConnectionClosed as e:
-            logging.error(f"WebSocket connection closed: {e.code}, {e.reason}")
-            await self.__stream_market_on_close(ws, e.code, e.reason)
+            await self.__stream_market_on_close(shard, e.code, e.reason)
         except Exception as e:
-            logging.error(f"WebSocket error: {e}")
             await self.__stream_market_on_error(ws, e)
+            await self.__stream_market_on_close(shard, None, str(e))
 
     async def beginStream(self):
-        self.__connect()
-        await self.__stream_market()
+        await asyncio.to_thread(self.__connect)
+        if self.recorder is not None:
+            self.recorder.start()
+        await self._run_shards()
 
     async def endStream(self):
-        if hasattr(self, 'ping_task') and self.ping_task:
-            self.ping_task.cancel()
-            try:
-                await self.ping_task
-            except asyncio.CancelledError:
-                logging.info("Ping task cancelled")
-        if hasattr(self, 'ws') and self.ws:
-            await self.ws.close()
-            logging.info("Websocket closed by endStream")
+        await self._close_shards()
+        if self.recorder is not None:
+            await asyncio.to_thread(self.recorder.stop)
+        await self._gamma.close()
+        logging.info("Websockets closed by endStream")
     
-    def _download_markets(self, obj_vector, evt: Event):
-        # download from polymarket
-        limit = 100  # Set the number of items to fetch per request
-        offset = 0
+    async def _market_pages(self, params: dict, limit: int, parallelism: int, overlap: int = 0):
+        """Yields pages of the Gamma /markets endpoint in order, fetching `parallelism` offset windows at a time.
 
+        Consecutive windows share `overlap` rows, so markets shifting up the listing while it is walked are
+        seen twice rather than skipped.
+        """
+        step = limit - overlap
+        offset = 0
         while True:
-            params = {
-                "order": "createdAt",
-                "ascending": "True",
-                "archived": "false",
-                "active": "true",
-                "closed": "false",
-                "limit": limit,
-                "offset": offset
-            }
-
-            response = requests.get(self._gamma_host + "/markets", params=params)
-            response_data = response.json()  # Convert the response to JSON
-            
-            # Check if there's data in the response
-            if isinstance(response_data, list) and response_data:
-                obj_vector.extend(response_data)  # Add the current page of markets to the list
-                offset += limit  # Move to the next set of data
+            pages = await self._gamma.get_many(
+                [("/markets", {**params, "limit": limit, "offset": offset + i * step}) for i in range(parallelism)])
+            for page in pages:
+                page = page if isinstance(page, list) else []
+                yield page
+                # a short page is the end of the listing, later windows are empty
+                if len(page) < limit:
+                    return
+            offset += parallelism * step
+
+    @staticmethod
+    def _market_key(market: dict) -> str:
+        return market.get("conditionId") or str(market["id"])
+
+    @staticmethod
+    def _is_open(market: dict) -> bool:
+        return bool(market.get("active")) and not market.get("closed") and not market.get("archived")
+
+    @staticmethod
+    def _parse_stamp(stamp: str) -> datetime:
+        return datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+
+    async def _download_markets(self, obj_vector, evt: Event, full: bool = False, limit: int = 100, parallelism: int = 8,
+                                overlap: timedelta = timedelta(minutes=10), overlap_rows: int = 10):
+        # download from polymarket
+        params = {}
+        try:
+            known = await asyncio.to_thread(self.catalog.updated_at)
+            incremental = bool(known) and not full
+            if incremental:
+                # newest modifications first, so the listing can stop a little before the previous refresh's watermark;
+                # closed markets are listed too, so the ones which closed since then are removed
+                params.update(order="updatedAt", ascending="false")
+                stamps = [stamp for stamp in known.values() if stamp]
+                watermark = self._parse_stamp(max(stamps)) - overlap if stamps else None
             else:
-                break
-        # set event flag to false
-        evt.set()
-        # save to class & file
-        self.markets = obj_vector
-        with open(self._markets_dir, "w") as markets_file:
-            try:
-                obj_dict = {"last_update": datetime.now().strftime("%d/%m/%Y, %H:%M:%S"), "markets": obj_vector}
-                json.dump(obj_dict, markets_file, indent=4)
-            except Exception as e:
-                logging.error(f"Error reading markets file stored at {self._markets_dir}:\n{e}")
+                params.update(archived="false", active="true", closed="false", order="createdAt", ascending="true")
+            changed, closed = {}, set()
+            async for page in self._market_pages(params, limit, parallelism, overlap_rows):
+                reached_watermark = False
+                for market in page:
+                    key, stamp = self._market_key(market), market.get("updatedAt")
+                    if incremental and stamp is not None and watermark is not None and self._parse_stamp(stamp) <= watermark:
+                        reached_watermark = True
+                    if not self._is_open(market):
+                        if key in known:
+                            closed.add(key)
+                    elif known.get(key) != stamp or stamp is None:
+                        changed[key] = market
+                if reached_watermark:
+                    break
+            # save to class & catalog, only markets which changed are written and closed ones are dropped
+            self.markets_last_updated = datetime.now()
+            await asyncio.to_thread(self.catalog.upsert, list(changed.values()), self.markets_last_updated, not incremental)
+            if closed:
+                await asyncio.to_thread(self.catalog.remove, closed)
+            logging.info(f"{len(changed)} Polymarket markets added or updated, {len(closed)} closed")
+            self._markets = None
+            obj_vector.extend(self.markets or [])
+        except Exception as e:
+            logging.error(f"Error downloading Polymarket markets: {e}")
+        finally:
+            # set event flag to false
+            evt.set()
+
+    async def _download_markets_standalone(self, obj_vector, evt: Event):
+        # the pooled session is bound to the temporary loop of the calling thread, release it with the loop
+        try:
+            await self._download_markets(obj_vector, evt)
+        finally:
+            await self._gamma.close()
 
+    @property
+    def markets(self):
+        # decoded from the catalog on first access only
+        if self._markets is None and len(self.catalog):
+            self._markets = self.catalog.all()
+        return self._markets
+
+    @markets.setter
+    def markets(self, markets):
+        self._markets = markets
 
     def getMarkets(self, download):
-        if (download or self.markets is None) or \
+        if (download or len(self.catalog) == 0) or \
            (download is None and self.markets_last_updated < datetime.now() - timedelta(1)):
             logging.info("Downloading markets data")
             evt = Event()
             markets = []
             evt.clear()
-            t = Thread(target=self._download_markets, args=(markets, evt))
-            t.start()
+            if self._loop is not None and self._loop.is_running():
+                asyncio.run_coroutine_threadsafe(self._download_markets(markets, evt), self._loop)
+            else:
+                Thread(target=asyncio.run, args=(self._download_markets_standalone(markets, evt),)).start()
             # returns an Event object for market download & the datastructure itself
             return (evt, markets)
 
@@ -0,0 +1,114 @@
+import asyncio
+import glob
+import gzip
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from .base_gateway import Gateway
+from .polymarket_books import PolymarketBooks
+from trading.order_book import TickBook
+
+
+class ReplayGateway(PolymarketBooks, Gateway):
+    """Replays Polymarket market channel logs recorded by the TickRecorder as if they came from the live stream.
+
+    Every asset's files are memory-mapped and read in order, assets are k-way merged on the
+    event timestamp and each event goes through the same book building path as PolymarketGateway.
+
+    Keyword arguments:
+    directory -- folder holding the recorded `{asset_id}[.{YYYYMMDD}].log[.gz]` files
+    assets -- assets to replay, every recorded asset by default
+    speed -- None to replay as fast as possible, otherwise a wall clock multiplier (1.0 is real time)
+    start, end -- optional bounds of the replayed session, in epoch milliseconds
+    """
+
+    NAME = "ReplayGateway"
+    _FILE_RE = re.compile(r"^(?P<asset>[^.]+)(?:\.(?P<day>\d{8}))?\.log(?:\.gz)?$")
+    _YIELD_EVERY = 1000
+
+    def __init__(self, directory: str = "data/polymarket_ws_markets", assets: List[str] = None, speed: float = None,
+                 start: int = None, end: int = None):
+        self.directory = directory
+        self.assets = assets
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.books: Dict[str, TickBook] = {}
+        self.replayed = 0
+        self.finished = False
+        self._stopped = False
+
+    def _files(self) -> Dict[str, List[str]]:
+        files: Dict[str, List[Tuple[str, str]]] = {}
+        for path in glob.glob(os.path.join(self.directory, "*.log*")):
+            match = self._FILE_RE.match(os.path.basename(path))
+            if match is None or (self.assets is not None and match["asset"] not in self.assets):
+                continue
+            # undated legacy files predate the daily ones
+            files.setdefault(match["asset"], []).append((match["day"] or "", path))
+        return {asset: [path for _, path in sorted(paths)] for asset, paths in files.items()}
+
+    @staticmethod
+    def _lines(path: str) -> Iterator[bytes]:
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as f:
+                yield from f
+            return
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            line = mm.readline()
+            while line:
+                yield line
+                line = mm.readline()
+
+    def _events(self, paths: List[str]) -> Iterator[Tuple[int, dict]]:
+        start, end = self.start, self.end
+        for path in paths:
+            for line in self._lines(path):
+                try:
+                    event = json.loads(line)
+                    timestamp = int(event["timestamp"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    return
+                yield timestamp, event
+
+    def events(self) -> Iterator[Tuple[int, dict]]:
+        """Yields (timestamp in ms, event) of every replayed asset merged in timestamp order."""
+        streams = [self._events(paths) for paths in self._files().values()]
+        return heapq.merge(*streams, key=lambda item: item[0])
+
+    async def beginStream(self):
+        self.replayed, self.finished, self._stopped = 0, False, False
+        first_ts, wall_start = None, time.monotonic()
+        for timestamp, event in self.events():
+            if self._stopped:
+                break
+            if self.speed is not None:
+                if first_ts is None:
+                    first_ts = timestamp
+                delay = wall_start + (timestamp - first_ts) / 1000 / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self._process_pm_event(event)
+            self.replayed += 1
+            if self.speed is None and self.replayed % self._YIELD_EVERY == 0:
+                # let strategies and other gateways run between batches
+                await asyncio.sleep(0)
+        elapsed = time.monotonic() - wall_start
+        self.finished = True
+        self._notify("replay_finished", None, self.replayed)
+        logging.info(f"Replayed {self.replayed} events in {elapsed:.2f}s ({self.replayed / max(elapsed, 1e-9):.0f} events/s)")
+
+    async def endStream(self):
+        self._stopped = True
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+import aiohttp
+
+
+class AsyncRestClient:
+    """Keep-alive HTTP client shared by the REST calls of a gateway.
+
+    The underlying aiohttp session (and its connection pool) is created lazily on the loop
+    that first uses it, so TCP and TLS handshakes are paid once per connection instead of once
+    per request. `headers` may be a callable building per-request headers, e.g. for signing.
+    """
+
+    def __init__(self, host: str, max_connections: int = 16, keepalive: float = 30.0, timeout: float = 30.0,
+                 headers: Callable[[str, str], Dict[str, str]] = None):
+        self.host = host
+        self._max_connections = max_connections
+        self._keepalive = keepalive
+        self._timeout = timeout
+        self._headers = headers
+        self._session: aiohttp.ClientSession = None
+        self._session_loop: asyncio.AbstractEventLoop = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self._max_connections, keepalive_timeout=self._keepalive)
+            self._session = aiohttp.ClientSession(connector=connector, json_serialize=json.dumps,
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout))
+            self._session_loop = loop
+        return self._session
+
+    async def get(self, path: str, params: Dict = None):
+        """Returns the decoded JSON body of a GET request on `path`."""
+        session = await self._get_session()
+        headers = self._headers("GET", path) if self._headers is not None else None
+        async with session.get(self.host + path, params=params, headers=headers) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=json.loads, content_type=None)
+
+    async def get_many(self, requests: Iterable[tuple], concurrency: int = None) -> List:
+        """Runs independent (path, params) GET requests concurrently over the pool, preserving order."""
+        semaphore = asyncio.Semaphore(concurrency or self._max_connections)
+
+        async def bounded(path, params):
+            async with semaphore:
+                return await self.get(path, params)
+
+        return await asyncio.gather(*(bounded(path, params) for path, params in requests))
+
+    async def paginate(self, path: str, params: Dict, items_key: str, on_page: Callable[[List], Awaitable] = None,
+                       cursor_key: str = "cursor") -> List:
+        """Walks a cursor-paginated endpoint, requesting the next page while the current one is handled.
+
+        Keyword arguments:
+        path -- endpoint to query
+        params -- query parameters sent with every page
+        items_key -- key of the list of items in each page
+        on_page -- optional coroutine called with the items of each page as soon as it arrives
+        cursor_key -- key holding the next cursor, both in responses and requests (default "cursor")
+        Return: list of every item received
+        """
+        items = []
+        pending = asyncio.ensure_future(self.get(path, params))
+        try:
+            while pending is not None:
+                page = await pending
+                cursor = page.get(cursor_key)
+                pending = asyncio.ensure_future(self.get(path, {**params, cursor_key: cursor})) if cursor else None
+                page_items = page.get(items_key) or []
+                logging.debug(f"Fetched {len(page_items)} items from {path}, next cursor {cursor!r}")
+                items.extend(page_items)
+                if on_page is not None:
+                    await on_page(page_items)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+        return items
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
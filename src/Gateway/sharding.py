@@ -0,0 +1,178 @@
+import asyncio
+from typing import Dict, Iterable, List
+
+from .supervisor import ConnectionSupervisor
+
+
+class StreamShard:
+    """One websocket connection of a gateway and the markets it carries."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.markets: List[str] = []
+        self.ws = None
+        self.supervisor: ConnectionSupervisor = None
+        self.task: asyncio.Task = None
+        # venue specific per-connection state (subscription ids, sequence numbers...)
+        self.state: Dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def __repr__(self):
+        return f"StreamShard({self.index}, {len(self.markets)} markets)"
+
+
+class ShardedSubscriptions:
+    """Spreads subscribed markets over connections carrying at most `max_per_connection` markets each.
+
+    New markets fill the least loaded shard with room left; a shard is only created once every
+    existing one is full, so connections are added as the subscription set grows.
+    """
+
+    def __init__(self, max_per_connection: int):
+        if max_per_connection < 1:
+            raise ValueError("max_per_connection must be at least 1")
+        self.max_per_connection = max_per_connection
+        self.shards: List[StreamShard] = []
+        self._shard_of: Dict[str, StreamShard] = {}
+
+    def __contains__(self, market: str) -> bool:
+        return market in self._shard_of
+
+    def markets(self) -> List[str]:
+        return list(self._shard_of)
+
+    def shard_of(self, market: str) -> StreamShard:
+        return self._shard_of.get(market)
+
+    def add(self, markets: Iterable[str]) -> Dict[StreamShard, List[str]]:
+        """Assigns the markets not subscribed yet to shards, returning the new markets of each shard."""
+        added: Dict[StreamShard, List[str]] = {}
+        for market in markets:
+            if market in self._shard_of:
+                continue
+            candidates = [shard for shard in self.shards if len(shard.markets) < self.max_per_connection]
+            if candidates:
+                shard = min(candidates, key=lambda shard: len(shard.markets))
+            else:
+                shard = StreamShard(len(self.shards))
+                self.shards.append(shard)
+            shard.markets.append(market)
+            self._shard_of[market] = shard
+            added.setdefault(shard, []).append(market)
+        return added
+
+    def remove(self, markets: Iterable[str]) -> Dict[StreamShard, List[str]]:
+        """Drops markets from their shards, returning the removed markets of each shard."""
+        removed: Dict[StreamShard, List[str]] = {}
+        for market in markets:
+            shard = self._shard_of.pop(market, None)
+            if shard is None:
+                continue
+            shard.markets.remove(market)
+            removed.setdefault(shard, []).append(market)
+        return removed
+
+
+class ShardedStream:
+    """Mixin giving a websocket gateway runtime subscription management over sharded connections.
+
+    Subclasses implement `_stream_shard` (one connection session, calling `shard.supervisor.connected()`
+    once its markets are subscribed), `_send_subscribe` and `_send_unsubscribe`. Each shard runs under
+    its own ConnectionSupervisor, so one connection dropping leaves the others streaming.
+    """
+
+    def _init_shards(self, markets: Iterable[str], max_per_connection: int):
+        self._subscriptions = ShardedSubscriptions(max_per_connection)
+        self._subscriptions.add(markets)
+        self._loop: asyncio.AbstractEventLoop = None
+        self._stream_closed: asyncio.Event = None
+
+    @property
+    def subscribed_markets(self) -> List[str]:
+        return self._subscriptions.markets()
+
+    @property
+    def shards(self) -> List[StreamShard]:
+        return self._subscriptions.shards
+
+    async def _stream_shard(self, shard: StreamShard):
+        raise NotImplementedError()
+
+    async def _send_subscribe(self, shard: StreamShard, markets: List[str]):
+        raise NotImplementedError()
+
+    async def _send_unsubscribe(self, shard: StreamShard, markets: List[str]):
+        raise NotImplementedError()
+
+    def _start_shard(self, shard: StreamShard):
+        shard.supervisor = ConnectionSupervisor(f"{self.NAME}[{shard.index}]", lambda: self._stream_shard(shard))
+        shard.task = asyncio.create_task(shard.supervisor.run())
+
+    async def _stop_shard(self, shard: StreamShard):
+        if shard.supervisor is not None:
+            shard.supervisor.stop()
+        if shard.ws is not None:
+            await shard.ws.close()
+        if shard.task is not None:
+            try:
+                await asyncio.wait_for(shard.task, timeout=5)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                shard.task.cancel()
+        shard.task = None
+
+    async def _subscribe(self, markets: List[str]):
+        for shard, added in self._subscriptions.add(markets).items():
+            if not shard.running:
+                self._start_shard(shard)
+            elif shard.ws is not None:
+                await self._send_subscribe(shard, added)
+            # otherwise the shard is reconnecting and will subscribe its whole market list when it opens
+
+    async def _unsubscribe(self, markets: List[str]):
+        for shard, removed in self._subscriptions.remove(markets).items():
+            if not shard.markets:
+                await self._stop_shard(shard)
+            elif shard.ws is not None:
+                await self._send_unsubscribe(shard, removed)
+
+    def _streaming(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    def subscribe(self, markets: List[str]):
+        """Adds markets to the stream, opening new connections as shards fill up. Safe to call from any thread.
+        Return: concurrent Future completing once subscriptions are sent, None if the stream is not running
+        """
+        if not self._streaming():
+            # picked up by the shards when the stream starts
+            self._subscriptions.add(markets)
+            return None
+        return asyncio.run_coroutine_threadsafe(self._subscribe(list(markets)), self._loop)
+
+    def unsubscribe(self, markets: List[str]):
+        """Removes markets from the stream, closing connections left without markets. Safe to call from any thread."""
+        if not self._streaming():
+            self._subscriptions.remove(markets)
+            return None
+        return asyncio.run_coroutine_threadsafe(self._unsubscribe(list(markets)), self._loop)
+
+    def reconnectMetrics(self) -> Dict[int, dict]:
+        return {shard.index: shard.supervisor.metrics() for shard in self.shards if shard.supervisor is not None}
+
+    async def _run_shards(self):
+        self._loop = asyncio.get_running_loop()
+        self._stream_closed = asyncio.Event()
+        for shard in self.shards:
+            if shard.markets:
+                self._start_shard(shard)
+        await self._stream_closed.wait()
+
+    async def _close_shards(self):
+        for shard in self.shards:
+            await self._stop_shard(shard)
+        # later subscription changes go straight to the shard map until the stream runs again
+        self._loop = None
+        if self._stream_closed is not None:
+            self._stream_closed.set()
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque
+
+
+class ConnectionSupervisor:
+    """Keeps a streaming connection alive by re-running `connect` whenever it returns or raises.
+
+    `connect` should open the connection, call `connected()` once subscriptions are sent and then
+    consume messages until the connection drops. Waits between attempts use exponential backoff
+    with full jitter through `asyncio.sleep`, so a flapping venue never blocks the event loop
+    or the other gateways sharing it.
+    """
+
+    def __init__(self, name: str, connect: Callable[[], Awaitable[None]], base_delay: float = 1.0,
+                 max_delay: float = 60.0, stable_after: float = 60.0, history: int = 100):
+        self.name = name
+        self._connect = connect
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._stable_after = stable_after
+        self._stopped = False
+        self._wake: asyncio.Event = None
+        self._attempt = 0
+        self._connected_at: float = None
+        self._down_since: float = None
+        self.reconnects = 0
+        self.reconnect_times: Deque[float] = deque(maxlen=history)
+
+    def connected(self):
+        """Marks the connection as established, recording how long the stream was down."""
+        now = time.monotonic()
+        self._connected_at = now
+        if self._down_since is not None:
+            downtime = now - self._down_since
+            self.reconnects += 1
+            self.reconnect_times.append(downtime)
+            logging.info(f"{self.name} reconnected after {downtime:.2f}s (reconnect #{self.reconnects})")
+        self._down_since = None
+
+    def metrics(self) -> dict:
+        times = self.reconnect_times
+        return {
+            "reconnects": self.reconnects,
+            "connected": self._down_since is None and self._connected_at is not None,
+            "last_time_to_reconnect": times[-1] if times else None,
+            "mean_time_to_reconnect": sum(times) / len(times) if times else None,
+            "max_time_to_reconnect": max(times) if times else None,
+        }
+
+    def _disconnected(self):
+        now = time.monotonic()
+        # only a session which stayed up for a while starts the backoff over, failed attempts keep growing it
+        if self._connected_at is not None and now - self._connected_at >= self._stable_after:
+            self._attempt = 0
+        self._connected_at = None
+        if self._down_since is None:
+            self._down_since = now
+
+    def _next_delay(self) -> float:
+        self._attempt += 1
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** self._attempt))
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        while not self._stopped:
+            try:
+                await self._connect()
+                logging.info(f"{self.name} stream closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"{self.name} stream error: {e}")
+            if self._stopped:
+                break
+            self._disconnected()
+            delay = self._next_delay()
+            logging.info(f"{self.name} reconnecting in {delay:.2f}s")
+            try:
+                # stop() cuts the wait short
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """Stops reconnecting, must be called from the loop running `run`."""
+        self._stopped = True
+        if self._wake is not None:
+            self._wake.set()
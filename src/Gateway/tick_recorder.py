@@ -0,0 +1,145 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Thread
+from typing import Dict, List, Tuple
+
+
+class TickRecorder:
+    """Appends raw stream records as JSON lines to one file per key and day, off the event loop.
+
+    `record` only enqueues; a writer thread serializes records, keeps a bounded LRU of open
+    file handles and writes in batches, flushing once `flush_records` records are pending or
+    `flush_interval` seconds have passed. Files are named `{key}.{YYYYMMDD}.log` (UTC) and,
+    with `compress` set, gzipped once their day is over.
+    """
+
+    def __init__(self, directory: str, max_open_files: int = 64, flush_records: int = 1000,
+                 flush_interval: float = 1.0, compress: bool = False, max_queue: int = 1_000_000):
+        self.directory = directory
+        self._max_open_files = max_open_files
+        self._flush_records = flush_records
+        self._flush_interval = flush_interval
+        self._compress = compress
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._handles: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+        self._thread: Thread = None
+        self._day: str = None
+        self.written = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y%m%d")
+
+    def path(self, key: str, day: str) -> str:
+        return os.path.join(self.directory, f"{key}.{day}.log")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = Thread(target=self._run, name="TickRecorder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flushes what is queued and closes every file."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, key: str, record):
+        """Queues `record` (a dict, or an already serialized line) for `key` without blocking."""
+        try:
+            self._queue.put_nowait((key, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {"queue_depth": self.queue_depth(), "written": self.written, "dropped": self.dropped,
+                "open_files": len(self._handles)}
+
+    def _handle(self, key: str, day: str):
+        handle = self._handles.get((key, day))
+        if handle is not None:
+            self._handles.move_to_end((key, day))
+            return handle
+        if len(self._handles) >= self._max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        handle = open(self.path(key, day), "a", buffering=1 << 16)
+        self._handles[(key, day)] = handle
+        return handle
+
+    def _flush(self, pending: Dict[str, List[str]]):
+        day = self._today()
+        if day != self._day:
+            self._rotate(day)
+        for key, lines in pending.items():
+            self._handle(key, day).write("".join(lines))
+            self.written += len(lines)
+        for handle in self._handles.values():
+            handle.flush()
+        pending.clear()
+
+    def _rotate(self, day: str):
+        previous, self._day = self._day, day
+        for handle_key in [handle_key for handle_key in self._handles if handle_key[1] != day]:
+            self._handles.pop(handle_key).close()
+        if previous is not None and self._compress:
+            for path in glob.glob(os.path.join(self.directory, f"*.{previous}.log")):
+                try:
+                    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(f"Could not compress {path}: {e}")
+
+    def _run(self):
+        pending: Dict[str, List[str]] = {}
+        n_pending, last_flush = 0, time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                key, record = item
+                line = record if isinstance(record, str) else json.dumps(record)
+                pending.setdefault(key, []).append(line + "\n")
+                n_pending += 1
+            if n_pending >= self._flush_records or (n_pending and time.monotonic() - last_flush >= self._flush_interval):
+                try:
+                    self._flush(pending)
+                except OSError as e:
+                    logging.error(f"Tick recorder failed to write to {self.directory}: {e}")
+                    pending.clear()
+                n_pending, last_flush = 0, time.monotonic()
+        # drain whatever was queued before stop
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item:
+                key, record = item
+                pending.setdefault(key, []).append((record if isinstance(record, str) else json.dumps(record)) + "\n")
+        if pending:
+            self._flush(pending)
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
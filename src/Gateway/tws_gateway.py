@@ -9,10 +9,16 @@ from ibapi.utils import iswrapper
 
 import pandas as pd
 import time
-from threading import Lock
+import asyncio
+from threading import Lock, Thread
+from concurrent.futures import Future
+from typing import Dict
 
 from .base_gateway import Gateway
+from .tws_scheduler import HistoricalRequestScheduler
 from trading.order_types import Side
+from trading.order_book import DepthBook
+from utils import ColumnBuffer, LoopBridge, concat_tagged
 import logging
 
 
@@ -20,6 +26,10 @@ class TWSGateway(EWrapper, EClient, Gateway):
     NAME = "TWSGateway"
     dotenv.load_dotenv(".config/.env")
     _ACCOUNT_NAME = os.environ["TWS_ACCOUNT_NAME"]
+    # errors ending a historical data request: HMDS errors (pacing violations included), unknown or
+    # unsubscribed contracts, malformed requests and lost connectivity
+    _HISTORICAL_ERROR_CODES = frozenset({162, 166, 200, 320, 321, 322, 354, 366, 502, 504})
+    _BAR_COLUMNS = {"date": object, "open": float, "high": float, "low": float, "close": float}
     def __init__(self): 
         EClient.__init__(self, self)
         self.data = {}
@@ -27,9 +37,13 @@ class TWSGateway(EWrapper, EClient, Gateway):
                                                "Currency","Position","Avg cost"])
         
         self.summary_df = pd.DataFrame(columns = ["ReqId","Account","Value","Currency"])
-        self.books = {}
+        self.books: Dict[str, DepthBook] = {}
         self.books_locks = {}
-        self.historical_data = {}
+        self.historical_data: Dict[int, pd.DataFrame] = {}
+        self._historical_buffers: Dict[int, ColumnBuffer] = {}
+        self.historical_scheduler = HistoricalRequestScheduler(self)
+        self._bridge: LoopBridge = None
+        self._reader_thread: Thread = None
         
     @iswrapper
     def nextValidId(self, orderId):
@@ -46,6 +60,7 @@ class TWSGateway(EWrapper, EClient, Gateway):
     def pnl(self, reqId, dailyPnL, unrealizedPnL, realizedPnL):
         super().pnl(reqId, dailyPnL, unrealizedPnL, realizedPnL)
         self._pnl = {"ReqId":reqId, "DailyPnL": dailyPnL, "UnrealizedPnL": unrealizedPnL, "RealizedPnL": realizedPnL, "Timestamp": time.time()}
+        self._post("pnl", reqId, self._pnl)
         return self._pnl
 
     def accountSummary(self, reqId, account, tag, value, currency):
@@ -56,78 +71,102 @@ class TWSGateway(EWrapper, EClient, Gateway):
         logging.info(self.summary_df)
 
     def historicalData(self, reqId:int, bar):
-        if reqId not in self.historical_data:
-            self.historical_data[reqId] = pd.DataFrame(columns=['open', 'high', 'low', 'close'])
-        self.historical_data[reqId].loc[bar.date] = [bar.open, bar.high, bar.low, bar.close]
+        buffer = self._historical_buffers.get(reqId)
+        if buffer is None:
+            buffer = self._historical_buffers[reqId] = ColumnBuffer(self._BAR_COLUMNS)
+        buffer.append(bar.date, bar.open, bar.high, bar.low, bar.close)
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
        super().historicalDataEnd(reqId, start, end)
+       buffer = self._historical_buffers.pop(reqId, None)
+       if buffer is None:
+           buffer = ColumnBuffer(self._BAR_COLUMNS, capacity=0)
+       self.historical_data[reqId] = buffer.to_frame(index="date")
        logging.info(f"Data downloaded for {reqId}\n {self.historical_data[reqId].head()}")
+       self.historical_scheduler.complete(reqId, self.historical_data[reqId])
+       self._post("historical", reqId, self.historical_data[reqId])
+
+    def requestHistoricalData(self, contract: Contract, *args) -> Future:
+        """Schedules a reqHistoricalData call within IB pacing limits. `args` are the reqHistoricalData
+        arguments following the contract; the request id is available as `future.req_id`, taken from
+        a range reserved for the scheduler (`historical_scheduler.reserved`).
+        Return: Future resolving to the bars DataFrame, or raising HistoricalDataError
+        """
+        return self.historical_scheduler.submit(contract, *args)
+
+    def error(self, reqId, *args):
+        super().error(reqId, *args)
+        # recent ibapi versions pass an errorTime before errorCode
+        code, message = (args[1], args[2]) if isinstance(args[1], int) else (args[0], args[1])
+        if code in self._HISTORICAL_ERROR_CODES and self.historical_scheduler.fail(reqId, code, message):
+            self._historical_buffers.pop(reqId, None)
+
+    def getHistoricalData(self, symbols: Dict[int, str]) -> pd.DataFrame:
+        """Returns the completed historical requests in `symbols` as a single frame tagged with their symbol.
+
+        Keyword arguments:
+        symbols -- mapping of request id to the symbol the request was made for
+        Return: pandas.DataFrame with columns date, symbol, open, high, low, close
+        """
+        frames = [(symbol, self.historical_data.get(req_id)) for req_id, symbol in symbols.items()]
+        return concat_tagged(frames, "symbol", index_name="date")
 
     def reqMktDepth(self, *args, **kwargs) -> tuple[Lock, Lock]:
         """Will apply original reqMktDepth, but will return thread locks for bid and ask books
         """
-        super().reqMktDepth(*args, **kwargs)
         if args:
             ticker_id = str(args[0])
         elif "reqId" in kwargs:
             ticker_id = str(kwargs["reqId"])
         else:
             raise Exception
+        if self.historical_scheduler.reserved(int(ticker_id)):
+            raise ValueError(f"reqId {ticker_id} is in the range reserved for historical data requests")
+        super().reqMktDepth(*args, **kwargs)
         if ticker_id not in self.books:
-            self.books[ticker_id] = {
-                "bids":pd.DataFrame(columns=["timestamp", "price", "size", "vwap"]),
-                "asks":pd.DataFrame(columns=["timestamp", "price", "size", "vwap"])
-                }
-            self.books_locks[ticker_id] = {}
-            self.books_locks[ticker_id] = {
-                "bids": Lock(),
-                "asks": Lock()
-            }
-            bids_lock = self.books_locks[ticker_id]["bids"]
-            asks_lock = self.books_locks[ticker_id]["asks"]
-
-        return bids_lock, asks_lock
-    
-    def updateMktDepth(self, reqId, position, operation, side, price, size):
-        super().updateMktDepth(reqId, position, operation, side, price, size)
-        ticker_id = str(reqId)    
-        side_id = "bids" if side == Side.BID.value else "asks"
+            self.books[ticker_id] = DepthBook()
+            self.books_locks[ticker_id] = self.books[ticker_id].locks
 
-        with self.books_locks[ticker_id][side_id]:
-            if operation == 2:
-                self.books[ticker_id][side_id].loc[position] = [time.time(), None, None, None]
-            else:
-                self.books[ticker_id][side_id].loc[position] = [time.time(), price, int(size), None]
-                vwap = (self.books[ticker_id][side_id].iloc[:position+1]["price"] * \
-                         self.books[ticker_id][side_id].iloc[:position+1]["size"]).sum() / \
-                         self.books[ticker_id][side_id].iloc[:position+1]["size"].sum()
-                self.books[ticker_id][side_id].loc[position, "vwap"] = vwap
-        
-    def updateMktDepthL2(self, reqId, position, operation, side, price, size):
-        super().updateMktDepthL2(reqId, position, operation, side, price, size)
-        ticker_id = str(reqId)    
+        return self.books_locks[ticker_id]["bids"], self.books_locks[ticker_id]["asks"]
+
+    def _apply_depth(self, reqId, position, operation, side, price, size):
         side_id = "bids" if side == Side.BID.value else "asks"
+        self.books[str(reqId)].apply(side_id, position, operation, price, float(size))
+        self._post("depth", str(reqId), side_id)
 
-        with self.books_locks[ticker_id][side_id]:
-            if operation == 2:
-                self.books[ticker_id][side_id].loc[position] = [time.time(), None, None, None]
-            else:
-                self.books[ticker_id][side_id].loc[position] = [time.time(), price, int(size), None]
-                vwap = (self.books[ticker_id][side_id].iloc[:position+1]["price"] * \
-                         self.books[ticker_id][side_id].iloc[:position+1]["size"]).sum() / \
-                         self.books[ticker_id][side_id].iloc[:position+1]["size"].sum()
-                self.books[ticker_id][side_id].loc[position, "vwap"] = vwap
+    def updateMktDepth(self, reqId, position, operation, side, price, size):
+        super().updateMktDepth(reqId, position, operation, side, price, size)
+        self._apply_depth(reqId, position, operation, side, price, size)
+
+    def updateMktDepthL2(self, reqId, position, marketMaker, operation, side, price, size, isSmartDepth):
+        super().updateMktDepthL2(reqId, position, marketMaker, operation, side, price, size, isSmartDepth)
+        self._apply_depth(reqId, position, operation, side, price, size)
     
     def establish_connection(self):
         self.connect(host='127.0.0.1', port=7496, clientId=23)
 
-    def beginStream(self):
-        self.establish_connection()
-        self.run()
-
-    def endStream(self):
-        pass
+    def _post(self, kind: str, key=None, data=None):
+        """Forwards an event raised on the reader thread to the listeners on the engine loop."""
+        if self._bridge is not None:
+            self._bridge.post((kind, key, data))
+
+    def _dispatch_events(self, batch):
+        for kind, key, data in batch:
+            self._notify(kind, key, data)
+
+    async def beginStream(self):
+        self._bridge = LoopBridge(asyncio.get_running_loop(), self._dispatch_events)
+        await asyncio.to_thread(self.establish_connection)
+        # EClient.run blocks until disconnection, decoding messages and invoking callbacks on its own thread
+        self._reader_thread = Thread(target=self.run, name=f"{self.NAME} reader", daemon=True)
+        self._reader_thread.start()
+
+    async def endStream(self):
+        self.disconnect()
+        self.historical_scheduler.cancel_all()
+        if self._reader_thread is not None:
+            await asyncio.to_thread(self._reader_thread.join, 5)
+        self._bridge = None
 
 if __name__ == "__main__":
     app = TWSGateway()
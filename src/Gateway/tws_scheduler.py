@@ -0,0 +1,167 @@
+import itertools
+import logging
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from threading import Lock, Timer
+from typing import Deque, Dict, Tuple
+
+PacingRule = namedtuple("PacingRule", ["limit", "period"])
+_PendingRequest = namedtuple("_PendingRequest", ["req_id", "contract", "args", "future"])
+
+
+class HistoricalDataError(Exception):
+    def __init__(self, req_id: int, code: int, message: str):
+        super().__init__(f"Historical data request {req_id} failed with error {code}: {message}")
+        self.req_id = req_id
+        self.code = code
+        self.message = message
+
+
+class HistoricalRequestScheduler:
+    """Hands out request ids for reqHistoricalData and keeps as many requests in flight as IB pacing allows.
+
+    Each submitted request gets a Future which is resolved with the bars DataFrame on
+    historicalDataEnd, or with a HistoricalDataError when TWS reports an error for its id.
+    Requests exceeding the pacing rules are queued and sent as soon as a slot opens up.
+
+    Request ids are taken from `first_req_id` upwards, a range reserved for the scheduler: ids
+    chosen by callers for other requests must stay below it (see `reserved`).
+    """
+
+    MAX_IN_FLIGHT = 50
+    PACING_RULES = (PacingRule(60, 600.0),)
+    # IB flags six or more requests for the same contract, exchange and tick type within two seconds
+    CONTRACT_PACING_RULES = (PacingRule(5, 2.0),)
+    IDENTICAL_REQUEST_INTERVAL = 15.0
+
+    def __init__(self, app, first_req_id: int = 1 << 30):
+        self._app = app
+        self.first_req_id = first_req_id
+        self._ids = itertools.count(first_req_id)
+        self._lock = Lock()
+        self._queue: Deque[_PendingRequest] = deque()
+        self._in_flight: Dict[int, _PendingRequest] = {}
+        self._sent: Deque[float] = deque()
+        self._sent_by_contract: Dict[Tuple, Deque[float]] = {}
+        self._last_identical: Dict[Tuple, float] = {}
+        self._timer: Timer = None
+
+    @staticmethod
+    def _contract_key(contract) -> Tuple:
+        return (contract.conId, contract.symbol, contract.localSymbol, contract.secType, contract.exchange)
+
+    @staticmethod
+    def _pacing_key(request: _PendingRequest) -> Tuple:
+        # contract (exchange included) and whatToShow, the fourth argument after the contract
+        what_to_show = request.args[3] if len(request.args) > 3 else None
+        return HistoricalRequestScheduler._contract_key(request.contract) + (what_to_show,)
+
+    def reserved(self, req_id: int) -> bool:
+        """True when `req_id` lies in the range of ids handed out by the scheduler."""
+        return req_id >= self.first_req_id
+
+    def submit(self, contract, *args) -> Future:
+        """Queues a reqHistoricalData call, `args` being every argument after the contract."""
+        future = Future()
+        future.req_id = next(self._ids)
+        with self._lock:
+            self._queue.append(_PendingRequest(future.req_id, contract, args, future))
+        self._dispatch()
+        return future
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue) + len(self._in_flight)
+
+    def _wait_time(self, request: _PendingRequest, now: float) -> float:
+        """Seconds until `request` may be sent without breaking a pacing rule, 0 if it may be sent now."""
+        wait = 0.0
+        for rule in self.PACING_RULES:
+            if len(self._sent) >= rule.limit:
+                wait = max(wait, self._sent[-rule.limit] + rule.period - now)
+        contract_key = self._contract_key(request.contract)
+        contract_sent = self._sent_by_contract.get(self._pacing_key(request), ())
+        for rule in self.CONTRACT_PACING_RULES:
+            if len(contract_sent) >= rule.limit:
+                wait = max(wait, contract_sent[-rule.limit] + rule.period - now)
+        last_identical = self._last_identical.get(contract_key + request.args[:4])
+        if last_identical is not None:
+            wait = max(wait, last_identical + self.IDENTICAL_REQUEST_INTERVAL - now)
+        return wait
+
+    def _record(self, request: _PendingRequest, now: float):
+        horizon = max(rule.period for rule in self.PACING_RULES)
+        self._sent.append(now)
+        while self._sent and self._sent[0] < now - horizon:
+            self._sent.popleft()
+        contract_key = self._contract_key(request.contract)
+        contract_sent = self._sent_by_contract.setdefault(self._pacing_key(request), deque())
+        contract_sent.append(now)
+        contract_horizon = max(rule.period for rule in self.CONTRACT_PACING_RULES)
+        while contract_sent and contract_sent[0] < now - contract_horizon:
+            contract_sent.popleft()
+        self._last_identical[contract_key + request.args[:4]] = now
+
+    def _dispatch(self):
+        to_send = []
+        with self._lock:
+            now = time.monotonic()
+            while self._queue and len(self._in_flight) < self.MAX_IN_FLIGHT:
+                wait = self._wait_time(self._queue[0], now)
+                if wait > 0:
+                    self._schedule(wait)
+                    break
+                request = self._queue.popleft()
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                self._record(request, now)
+                self._in_flight[request.req_id] = request
+                to_send.append(request)
+        for request in to_send:
+            logging.debug(f"Sending historical data request {request.req_id}")
+            self._app.reqHistoricalData(request.req_id, request.contract, *request.args)
+
+    def _schedule(self, delay: float):
+        # called with the lock held; a pending timer already guarantees a later dispatch
+        if self._timer is not None:
+            return
+        self._timer = Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self._dispatch()
+
+    def complete(self, req_id: int, data) -> bool:
+        with self._lock:
+            request = self._in_flight.pop(req_id, None)
+        if request is None:
+            return False
+        request.future.set_result(data)
+        self._dispatch()
+        return True
+
+    def fail(self, req_id: int, code: int, message: str) -> bool:
+        with self._lock:
+            request = self._in_flight.pop(req_id, None)
+        if request is None:
+            return False
+        request.future.set_exception(HistoricalDataError(req_id, code, message))
+        self._dispatch()
+        return True
+
+    def cancel_all(self):
+        with self._lock:
+            requests = list(self._queue) + list(self._in_flight.values())
+            self._queue.clear()
+            self._in_flight.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for request in requests:
+            if request.future.cancel() or request.future.done():
+                continue
+            request.future.set_exception(HistoricalDataError(request.req_id, -1, "scheduler stopped"))
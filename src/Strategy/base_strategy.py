@@ -22,7 +22,14 @@ class BaseStrategy(BaseClient):
         
         yaml.safe_dump(strategy_params, open(".config/client_params.yaml", "w"))
 
+    def _update_client_params(self, **params):
+        """Writes `params` into this strategy's section of the client parameters file."""
+        strategy_params = yaml.safe_load(open(".config/client_params.yaml", "r")) or {}
+        strategy_params.setdefault(self.NAME, {}).update(params)
+        yaml.safe_dump(strategy_params, open(".config/client_params.yaml", "w"))
+
     def _instantiate_sqlite_connection(self):
-        self.conn = sqlite3.connect(self._app._DB_PATH)
+        # async strategies open and use the connection from different worker threads, never concurrently
+        self.conn = sqlite3.connect(self._app._DB_PATH, check_same_thread=False)
 
 
@@ -0,0 +1,133 @@
+import logging
+import sqlite3
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureStore:
+    """Per-symbol time series table in the strategy database, keyed by (symbol, timestamp).
+
+    The table is clustered on its primary key (WITHOUT ROWID), so the key is a covering index for
+    per-symbol range scans and MAX(timestamp) lookups. Writes are batched `executemany` upserts of
+    the rows given only, in WAL mode, so persisting costs grow with new data and not with history.
+    Timestamps are stored as UTC epoch nanoseconds.
+
+    Keyword arguments:
+    conn -- open SQLite connection
+    table -- name of the table
+    columns -- value columns and their SQLite types, e.g. {"close": "REAL"}
+    batch_size -- rows per executemany call (default 10000)
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, columns: Dict[str, str], batch_size: int = 10000):
+        self.conn = conn
+        self.table = table
+        self.columns = dict(columns)
+        self.batch_size = batch_size
+        self._ensure()
+
+    def _ensure(self):
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        primary_key = [row[1] for row in sorted(
+            (row for row in self.conn.execute(f"PRAGMA table_info({self.table})") if row[5]), key=lambda row: row[5])]
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (self.table,)).fetchone()
+        if exists and primary_key != ["symbol", "timestamp"]:
+            self._migrate()
+            return
+        self._create(self.table)
+
+    def _create(self, table: str):
+        columns = "".join(f", {name} {kind}" for name, kind in self.columns.items())
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (symbol TEXT NOT NULL, timestamp INTEGER NOT NULL"
+                          f"{columns}, PRIMARY KEY (symbol, timestamp)) WITHOUT ROWID")
+        self.conn.commit()
+
+    def _migrate(self):
+        """Moves a table written by DataFrame.to_sql (no key, text timestamps) to the keyed layout."""
+        logging.info(f"Migrating {self.table} to a (symbol, timestamp) keyed table")
+        legacy = f"{self.table}_legacy"
+        self.conn.execute(f"ALTER TABLE {self.table} RENAME TO {legacy}")
+        self._create(self.table)
+        available = {row[1] for row in self.conn.execute(f"PRAGMA table_info({legacy})")}
+        columns = ["symbol", "timestamp"] + [name for name in self.columns if name in available]
+        for chunk in pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {legacy}", self.conn, chunksize=self.batch_size * 10):
+            self.upsert(chunk)
+        self.conn.execute(f"DROP TABLE {legacy}")
+        self.conn.commit()
+
+    @staticmethod
+    def _timestamps(values) -> np.ndarray:
+        return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).asi8
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        """Inserts the rows of `df` (symbol, timestamp and value columns), replacing rows with the same key.
+
+        Return: number of rows written
+        """
+        if df.empty:
+            return 0
+        names = ["symbol", "timestamp"] + list(self.columns)
+        # NaN values are bound as NULL by sqlite3
+        values = [df[name].to_numpy(dtype=np.float64).tolist() if name in df else [None] * len(df) for name in self.columns]
+        records = list(zip(df["symbol"].astype(str).tolist(), self._timestamps(df["timestamp"]).tolist(), *values))
+        updates = ", ".join(f"{name} = excluded.{name}" for name in self.columns)
+        sql = (f"INSERT INTO {self.table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+               f"ON CONFLICT(symbol, timestamp) DO UPDATE SET {updates}")
+        with self.conn:
+            for begin in range(0, len(records), self.batch_size):
+                self.conn.executemany(sql, records[begin:begin + self.batch_size])
+        return len(records)
+
+    def last_timestamps(self, symbols: Iterable[str] = None) -> Dict[str, int]:
+        """Latest stored timestamp of each symbol in epoch nanoseconds, symbols without rows are left out.
+
+        With `symbols` given every lookup is a seek on the key instead of a scan of the table.
+        """
+        if symbols is None:
+            return dict(self.conn.execute(f"SELECT symbol, MAX(timestamp) FROM {self.table} GROUP BY symbol"))
+        last = {}
+        for symbol in symbols:
+            row = self.conn.execute(f"SELECT MAX(timestamp) FROM {self.table} WHERE symbol = ?", (symbol,)).fetchone()
+            if row[0] is not None:
+                last[symbol] = row[0]
+        return last
+
+    def _where(self, symbols: Iterable[str] = None, start=None, end=None):
+        clauses, params = [], []
+        if symbols is not None:
+            symbols = list(symbols)
+            clauses.append(f"symbol IN ({', '.join('?' * len(symbols))})")
+            params.extend(symbols)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(int(self._timestamps([start])[0]))
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(int(self._timestamps([end])[0]))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, symbols: Iterable[str] = None, start=None, end=None) -> Dict[str, np.ndarray]:
+        """Returns the rows with start <= timestamp < end as one NumPy array per column, ordered by symbol and time.
+
+        Keyword arguments:
+        symbols -- symbols to read (default None, all)
+        start -- start of the range, anything accepted by pandas.to_datetime (default None)
+        end -- end of the range (default None)
+        Return: dict of column name to numpy.ndarray
+        """
+        where, params = self._where(symbols, start, end)
+        names: List[str] = ["symbol", "timestamp"] + list(self.columns)
+        cursor = self.conn.execute(f"SELECT {', '.join(names)} FROM {self.table}{where} ORDER BY symbol, timestamp", params)
+        # rows are streamed from the cursor straight into a record array, NULLs become NaN
+        dtype = np.dtype([("symbol", object), ("timestamp", np.int64)] + [(name, np.float64) for name in self.columns])
+        records = np.fromiter(cursor, dtype=dtype)
+        return {name: np.ascontiguousarray(records[name]) for name in names}
+
+    def frame(self, symbols: Iterable[str] = None, start=None, end=None) -> pd.DataFrame:
+        """Same as `query`, as a DataFrame with a UTC timestamp column."""
+        df = pd.DataFrame(self.query(symbols, start, end))
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+        return df
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class ModelRegistry:
+    """Versioned on-disk store of fitted models, one entry per key (e.g. a traded pair).
+
+    Every save writes `{directory}/{key}/v{version}.pkl` and records the version, the fingerprint of
+    the training data and the training time in `{directory}/manifest.json`. Models are unpickled on
+    first use only, and `is_current` tells whether a key was already trained on identical data, so
+    restarts reuse stored models instead of refitting them. The newest `keep` versions of each key
+    are kept.
+
+    Keyword arguments:
+    directory -- root directory of the registry
+    keep -- number of versions kept per key (default 3)
+    """
+
+    def __init__(self, directory: str, keep: int = 3):
+        self.directory = directory
+        self.keep = keep
+        self._lock = Lock()
+        self._loaded: Dict[str, object] = {}
+        self._manifest = self._read_manifest()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def _read_manifest(self) -> Dict[str, dict]:
+        try:
+            with open(self._manifest_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read model manifest {self._manifest_path}: {e}")
+            return {}
+
+    def _write_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._manifest_path)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return "-".join(re.sub(r"[^A-Za-z0-9_.]", "_", part) for part in parts)
+
+    @staticmethod
+    def fingerprint(*arrays) -> str:
+        """Digest of the shapes, dtypes and contents of the training arrays."""
+        digest = hashlib.blake2b(digest_size=16)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.shape}{array.dtype.str}".encode("utf-8"))
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._manifest
+
+    def entry(self, key: str) -> Optional[dict]:
+        return self._manifest.get(key)
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        entry = self._manifest.get(key)
+        return entry is not None and entry["fingerprint"] == fingerprint and os.path.exists(entry["path"])
+
+    def load(self, key: str):
+        """Returns the latest model of `key`, reading it from disk on first access. None if there is none."""
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+            entry = self._manifest.get(key)
+            if entry is None:
+                return None
+            with open(entry["path"], "rb") as f:
+                model = pickle.load(f)
+            self._loaded[key] = model
+            return model
+
+    def save(self, key: str, model, fingerprint: str) -> int:
+        """Stores a new version of `key` and makes it the current one.
+
+        Return: version number of the stored model
+        """
+        with self._lock:
+            previous = self._manifest.get(key)
+            version = previous["version"] + 1 if previous else 1
+            directory = os.path.join(self.directory, key)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"v{version}.pkl")
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+            self._manifest[key] = {"version": version, "fingerprint": fingerprint, "path": path,
+                                   "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            self._write_manifest()
+            self._loaded[key] = model
+            for old in range(1, version - self.keep + 1):
+                old_path = os.path.join(directory, f"v{old}.pkl")
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            return version
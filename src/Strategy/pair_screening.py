@@ -0,0 +1,132 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 5% critical value of the Engle-Granger test with two variables and a constant
+EG_CRITICAL_5PCT = -3.34
+
+SCREEN_COLUMNS = ["numerator", "denominator", "correlation", "beta", "half_life", "eg_stat"]
+
+
+def _residual_stats(log_prices: np.ndarray, numerators: np.ndarray, denominators: np.ndarray,
+                    betas: np.ndarray, alphas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Engle-Granger statistic and half-life of the spreads of a chunk of pairs.
+
+    Each spread `y_i - alpha - beta * y_j` is tested with a lag-0 Dickey-Fuller regression
+    `diff(e) = gamma * e[:-1]`; the statistic is the t-value of gamma and the half-life, in bars,
+    is `-ln(2) / ln(1 + gamma)` (infinite when the spread does not mean revert).
+    """
+    spreads = log_prices[:, numerators] - betas * log_prices[:, denominators] - alphas
+    lagged = spreads[:-1]
+    diffs = np.diff(spreads, axis=0)
+    sxx = np.einsum("ij,ij->j", lagged, lagged)
+    gamma = np.einsum("ij,ij->j", lagged, diffs) / sxx
+    residuals = diffs - gamma * lagged
+    dof = max(len(diffs) - 1, 1)
+    stderr = np.sqrt(np.einsum("ij,ij->j", residuals, residuals) / dof / sxx)
+    eg_stat = gamma / stderr
+    with np.errstate(divide="ignore", invalid="ignore"):
+        half_life = np.where((gamma < 0) & (gamma > -1), -np.log(2) / np.log1p(gamma), np.inf)
+    return eg_stat, half_life
+
+
+def _screen_chunk(shm_name: str, shape: Tuple[int, int], numerators: np.ndarray, denominators: np.ndarray,
+                  betas: np.ndarray, alphas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        log_prices = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        result = _residual_stats(log_prices, numerators, denominators, betas, alphas)
+        del log_prices
+        return result
+    finally:
+        shm.close()
+
+
+def screen_pairs(prices: np.ndarray, symbols: Sequence[str], min_correlation: float = 0.7,
+                 min_half_life: float = 5, max_half_life: float = 1440, max_eg_stat: float = EG_CRITICAL_5PCT,
+                 chunk_size: int = 256, workers: int = None) -> pd.DataFrame:
+    """Ranks every pair of a universe by how strongly its log price spread mean reverts.
+
+    Correlations of returns, hedge ratios and intercepts come from the covariance matrices of the
+    whole universe in one pass; pairs passing `min_correlation` are then tested for cointegration
+    (Engle-Granger on the spread) in chunks of `chunk_size` pairs fanned out to a process pool,
+    reading the prices from shared memory.
+
+    Keyword arguments:
+    prices -- time x symbols matrix of aligned prices without NaN
+    symbols -- symbol of each column of `prices`
+    min_correlation -- minimum correlation of the symbols' returns (default 0.7)
+    min_half_life -- minimum half-life of the spread, in bars (default 5)
+    max_half_life -- maximum half-life of the spread, in bars (default 1440)
+    max_eg_stat -- Engle-Granger statistic a spread must be below to count as cointegrated (default 5% critical value)
+    chunk_size -- number of pairs tested per task (default 256)
+    workers -- size of the process pool, None for one process per core (default None)
+    Return: pandas.DataFrame with the SCREEN_COLUMNS, most cointegrated pairs first
+    """
+    log_prices = np.log(np.ascontiguousarray(prices, dtype=np.float64))
+    n_bars, n_symbols = log_prices.shape
+    if n_bars < 3 or n_symbols < 2:
+        return pd.DataFrame(columns=SCREEN_COLUMNS)
+
+    returns = np.diff(log_prices, axis=0)
+    std = returns.std(axis=0)
+    usable = std > 0
+    z = np.where(usable, (returns - returns.mean(axis=0)) / np.where(usable, std, 1), 0)
+    correlation = z.T @ z / len(z)
+
+    centered = log_prices - log_prices.mean(axis=0)
+    covariance = centered.T @ centered / n_bars
+    variance = np.diag(covariance)
+
+    # both orderings are candidates, the hedge regression is not symmetric
+    numerators, denominators = np.nonzero((correlation >= min_correlation) & ~np.eye(n_symbols, dtype=bool)
+                                          & usable[:, None] & usable[None, :])
+    if not len(numerators):
+        return pd.DataFrame(columns=SCREEN_COLUMNS)
+    betas = covariance[numerators, denominators] / variance[denominators]
+    means = log_prices.mean(axis=0)
+    alphas = means[numerators] - betas * means[denominators]
+    logging.debug(f"Testing {len(numerators)} of {n_symbols * (n_symbols - 1)} ordered pairs for cointegration")
+
+    eg_stat = np.empty(len(numerators))
+    half_life = np.empty(len(numerators))
+    chunks = [slice(begin, begin + chunk_size) for begin in range(0, len(numerators), chunk_size)]
+    shm = shared_memory.SharedMemory(create=True, size=log_prices.nbytes)
+    try:
+        np.ndarray(log_prices.shape, dtype=np.float64, buffer=shm.buf)[:] = log_prices
+        # workers are spawned, the strategy screens from a thread and forking a multithreaded process can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [(chunk, pool.submit(_screen_chunk, shm.name, log_prices.shape, numerators[chunk],
+                                           denominators[chunk], betas[chunk], alphas[chunk])) for chunk in chunks]
+            for chunk, future in futures:
+                eg_stat[chunk], half_life[chunk] = future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    keep = (half_life >= min_half_life) & (half_life <= max_half_life) & (eg_stat <= max_eg_stat)
+    order = np.flatnonzero(keep)[np.argsort(eg_stat[keep], kind="stable")]
+    # keep the better hedge direction of each pair of symbols
+    unordered = np.minimum(numerators, denominators)[order] * n_symbols + np.maximum(numerators, denominators)[order]
+    _, first = np.unique(unordered, return_index=True)
+    order = order[np.sort(first)]
+
+    names = np.asarray(symbols, dtype=object)
+    return pd.DataFrame({
+        "numerator": names[numerators[order]],
+        "denominator": names[denominators[order]],
+        "correlation": correlation[numerators[order], denominators[order]],
+        "beta": betas[order],
+        "half_life": half_life[order],
+        "eg_stat": eg_stat[order],
+    }, columns=SCREEN_COLUMNS)
+
+
+def top_pairs(ranked: pd.DataFrame, top_k: int) -> List[List[str]]:
+    """Returns the `top_k` best ranked pairs, in the [numerator, denominator] format of the strategy parameters."""
+    return [[numerator, denominator] for numerator, denominator in ranked[["numerator", "denominator"]].head(top_k).itertuples(index=False)]
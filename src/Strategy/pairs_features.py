@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+FEATURES = ["close", "return_vol_1h", "return_vol_30m", "return_vol_10m", "rolling_mean"]
+
+# window lengths in minutes, return_vol_10m keeps the 30 minute window the existing models were trained with
+VOL_WINDOWS = {"return_vol_1h": 60, "return_vol_30m": 30, "return_vol_10m": 30}
+MEAN_WINDOW = 60
+MEAN_LAG = 30
+
+
+def pair_features(close: pd.Series) -> pd.DataFrame:
+    """Batch features of a pair ratio series, rows are NaN until every window is filled.
+
+    Keyword arguments:
+    close -- ratio of the pair's closes, indexed by minute
+    Return: pandas.DataFrame with the FEATURES columns
+    """
+    features = close.to_frame("close")
+    returns = close.pct_change()
+    for name, window in VOL_WINDOWS.items():
+        features[name] = returns.rolling(window).std()
+    features["rolling_mean"] = close.shift(MEAN_LAG).rolling(MEAN_WINDOW).mean()
+    return features
+
+
+class RollingMoments:
+    """Mean and sample standard deviation of the last `window` values, updated in O(1) per value.
+
+    Values are kept in a ring; the mean and the sum of squared deviations are updated with Welford's
+    recurrences as values enter and leave the window, and recomputed exactly from the ring every
+    `resync` updates so rounding errors cannot accumulate over long sessions.
+    """
+
+    def __init__(self, window: int, resync: int = 4096):
+        self.window = window
+        self._values = np.zeros(window)
+        self._pos = 0
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._resync = resync
+        self._updates = 0
+
+    def __len__(self):
+        return self._n
+
+    def push(self, x: float):
+        if self._n < self.window:
+            self._n += 1
+            delta = x - self._mean
+            self._mean += delta / self._n
+            self._m2 += delta * (x - self._mean)
+        else:
+            old = self._values[self._pos]
+            old_mean = self._mean
+            self._mean += (x - old) / self._n
+            self._m2 += (x - old) * (x - self._mean + old - old_mean)
+        self._values[self._pos] = x
+        self._pos = (self._pos + 1) % self.window
+        self._updates += 1
+        if self._updates % self._resync == 0:
+            values = self._values[:self._n]
+            self._mean = values.mean()
+            self._m2 = ((values - self._mean) ** 2).sum()
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self._n == self.window else np.nan
+
+    @property
+    def std(self) -> float:
+        if self._n < self.window:
+            return np.nan
+        return np.sqrt(max(self._m2, 0.0) / (self._n - 1))
+
+
+class PairFeatureEngine:
+    """Streaming counterpart of `pair_features`: each new ratio close updates every feature in O(1).
+
+    `update` returns the feature row of the latest close, ordered as FEATURES, with NaN until the
+    longest window is filled, so its output matches the last row of `pair_features` over the same closes.
+    """
+
+    def __init__(self):
+        self._vols = {window: RollingMoments(window) for window in set(VOL_WINDOWS.values())}
+        self._mean = RollingMoments(MEAN_WINDOW)
+        # closes not yet old enough to enter the lagged mean
+        self._lagged = np.zeros(MEAN_LAG)
+        self._n = 0
+        self._last = np.nan
+
+    def update(self, close: float) -> np.ndarray:
+        if self._n:
+            ret = close / self._last - 1
+            for moments in self._vols.values():
+                moments.push(ret)
+        if self._n >= MEAN_LAG:
+            self._mean.push(self._lagged[self._n % MEAN_LAG])
+        self._lagged[self._n % MEAN_LAG] = close
+        self._n += 1
+        self._last = close
+        return self.features()
+
+    def warm(self, closes) -> np.ndarray:
+        """Feeds a history of closes, returning the features of the last one."""
+        features = np.full(len(FEATURES), np.nan)
+        for close in closes:
+            features = self.update(close)
+        return features
+
+    def features(self) -> np.ndarray:
+        row = [self._last]
+        row.extend(self._vols[window].std for window in VOL_WINDOWS.values())
+        row.append(self._mean.mean)
+        return np.array(row, dtype=np.float64)
+
+
+def reversal_labels(close: pd.Series, rolling_mean: pd.Series, horizon: int = 30,
+                    upper: float = 1.005, lower: float = 0.995) -> pd.Series:
+    """Labels 1 the minutes where the close leaves the [lower, upper] band around the rolling mean
+    within the next `horizon` minutes (the current one included), 0 otherwise.
+
+    The forward window test is a difference of cumulative counts, so labeling is O(n). The last
+    `horizon - 1` minutes have no complete window and are left NaN.
+    """
+    close_values = close.to_numpy(dtype=np.float64)
+    mean_values = rolling_mean.to_numpy(dtype=np.float64)
+    outside = (close_values >= mean_values * upper) | (close_values <= mean_values * lower)
+    counts = np.concatenate(([0], np.cumsum(outside)))
+    labels = np.full(len(close_values), np.nan)
+    n_labeled = len(close_values) - horizon + 1
+    if n_labeled > 0:
+        labels[:n_labeled] = (counts[horizon:] - counts[:n_labeled]) > 0
+    return pd.Series(labels, index=close.index, name="reversal")
@@ -0,0 +1,48 @@
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+
+
+class LinearScorer:
+    """Scores many StandardScaler + LinearRegression pipelines in one vectorized pass.
+
+    Each pipeline is folded into a single affine map, `((x - mean) / scale) @ coef + intercept`
+    becoming `x @ (coef / scale) + (intercept - (mean / scale) @ coef)`, and the maps of all keys
+    are stacked into contiguous arrays. `score` then costs one multiply-and-sum over the feature
+    matrix, with none of the per-call validation of `Pipeline.predict`.
+    """
+
+    def __init__(self, models: Dict[Hashable, Pipeline]):
+        self.keys: List[Hashable] = [key for key, model in models.items() if model is not None]
+        self.rows: Dict[Hashable, int] = {key: row for row, key in enumerate(self.keys)}
+        n_features = len(models[self.keys[0]].steps[-1][1].coef_) if self.keys else 0
+        self.weights = np.empty((len(self.keys), n_features))
+        self.intercepts = np.empty(len(self.keys))
+        for row, key in enumerate(self.keys):
+            self.weights[row], self.intercepts[row] = self._fold(models[key])
+
+    @staticmethod
+    def _fold(model: Pipeline):
+        scaler, regressor = model.named_steps["StandardScaler"], model.named_steps["regressor"]
+        coef = np.asarray(regressor.coef_, dtype=np.float64).ravel()
+        mean = scaler.mean_ if scaler.with_mean else 0.0
+        scale = scaler.scale_ if scaler.with_std else 1.0
+        weights = coef / scale
+        return weights, float(regressor.intercept_) - float(np.dot(mean, weights))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """Returns the prediction of every key, `features` holding one row per key in the order of `keys`."""
+        return np.einsum("ij,ij->i", features, self.weights) + self.intercepts
+
+    def score_ready(self, features: np.ndarray) -> Tuple[List[Hashable], np.ndarray, np.ndarray]:
+        """Scores the keys whose feature row has no NaN (pairs still warming up are left out).
+
+        Return: the ready keys, their predictions and their feature rows, aligned with each other
+        """
+        ready = ~np.isnan(features).any(axis=1)
+        keys = [key for key, is_ready in zip(self.keys, ready) if is_ready]
+        return keys, self.score(features)[ready], features[ready]
@@ -1,107 +1,141 @@
 from .base_strategy import BaseStrategy
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
+from .feature_store import FeatureStore
+from .model_registry import ModelRegistry
+from .pairs_features import FEATURES, PairFeatureEngine
+from .pairs_inference import LinearScorer
+from .pairs_training import fit_pair
+from .pair_screening import screen_pairs, top_pairs
+from trading.price_panel import PricePanel
 from Gateway import Gateway
-from sklearn.linear_model import LinearRegression
-import time
-import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+import asyncio
 import pandas as pd
 import datetime as dt
 import numpy as np
 import logging
-import pickle
 
 class PairsTradingStrategy(BaseStrategy):
     NAME = "Pairs Trading Strategy"
     table_name = "pairs_trading"
-    _MODEL_PATH = ".models/pairs_trading_model.pkl"
+    _MODELS_DIR = ".models/pairs_trading"
+    _BAR_COLUMNS = {"open": "REAL", "high": "REAL", "low": "REAL", "close": "REAL",
+                    "volume": "REAL", "vwap": "REAL", "trade_count": "REAL"}
+    # woken by the completed minute bars of the gateway
+    EVENT_KINDS = ("bar",)
+    _HISTORY_DAYS = 30
+    # share of the minute grid a symbol must cover to be screened
+    _MIN_COVERAGE = 0.9
 
-    def __init__(self, app: Gateway, pairs: list[list[str, str]], **kwargs):
+    def __init__(self, app: Gateway, pairs: list[list[str, str]], training_workers: int = None,
+                 universe: list[str] = None, screen_top_k: int = None, **kwargs):
         super().__init__(app, **kwargs)
         self.pairs = pairs
+        self.training_workers = training_workers
+        # when screen_top_k is set, the traded pairs are re-screened from the universe at startup
+        self.universe = universe
+        self.screen_top_k = screen_top_k
 
-        # does the model exist?
-        if self._model_exists():
-            # if yes, load it
-            self.model = Pipeline.load(self._MODEL_PATH)
-        else:
-            # if not, create it
-            self.model_template = Pipeline([
-                ("StandardScaler", StandardScaler()),
-                ("regressor", LinearRegression())
-            ])
+        # fitted models are stored per pair and loaded on first use
+        self.registry = ModelRegistry(self._MODELS_DIR)
         self.models = {}
         self.temp_table = pd.DataFrame()
+        # latest timestamp of each symbol already persisted, only newer bars are written back
+        self._stored_until = {}
+        # minute closes of every symbol, shared by all pairs
+        self._panel: PricePanel = None
+        # streaming features of each pair and the last panel column they include
+        self.engines = {}
+        self.features = {}
+        self._last_column = {}
 
-    def begin(self):
-        super().begin()
+    async def on_start(self):
+        self._app = self._gateways[0]
+        # training, downloads and the database are blocking, they run off the engine loop
+        await asyncio.to_thread(self._prepare)
+
+    def _prepare(self):
         self._instantiate_sqlite_connection()
+        self.store = FeatureStore(self.conn, self.table_name, self._BAR_COLUMNS)
+        if self.screen_top_k:
+            self.screen(self.universe, self.screen_top_k)
         self._handle_training()
         self._download_latest_data()
         for pair in self.pairs:
-            nominator = self.temp_table[pair[0]]
-            denominator = self.temp_table[pair[1]]
-            nominator.drop(columns=["symbol"], inplace=True)
-            denominator.drop(columns=["symbol"], inplace=True)
-            nominator["timestamp"] = pd.to_datetime(nominator["timestamp"], format="%Y-%m-%d %H:%M:%S+00:00", utc = True)
-            nominator = nominator.set_index('timestamp').resample('T').ffill()
-            denominator["timestamp"] = pd.to_datetime(denominator["timestamp"], format="%Y-%m-%d %H:%M:%S+00:00", utc = True)
-            denominator = denominator.set_index('timestamp').resample('T').ffill()
-            denominator = pair[1]
-            self.fast_data[tuple(pair)] = pd.concat([nominator["close"].to_frame("numerator"), denominator["close"].to_frame("denominator")], axis=1)
-            self.fast_data.dropna(inplace=True)
-            self.fast_data["close"] = self.fast_data["numerator"]/self.fast_data["denominator"]
-            self.fast_data["return_vol_1h"] = self.fast_data["close"].pct_change().rolling(60).std()
-            self.fast_data["return_vol_30m"] = self.fast_data["close"].pct_change().rolling(30).std()
-            self.fast_data["return_vol_10m"] = self.fast_data["close"].pct_change().rolling(30).std()
-            self.fast_data["rolling_mean"] = self.fast_data["close"].shift(30).rolling(60).mean()
-            self.fast_data.dropna(inplace=True)
+            self.engines[tuple(pair)] = PairFeatureEngine()
+            self.features[tuple(pair)] = self.engines[tuple(pair)].warm(self._pair_close(pair).to_numpy())
+            self._last_column[tuple(pair)] = self._common_column(pair)
         self.commitment = {tuple(pair):False for pair in self.pairs}
-        while not self._eflag.is_set():
-            for pair in self.pairs:
-                if self.fast_data.index[-1] < self._app.hist_quotes[pair[1]].index[-1] \
-                    and self.fast_data.index[-1] < self._app.hist_quotes[pair[1]].index[-1]:
-                    latest_common_date = min(self._app.hist_quotes[pair[0]].index[-1], self._app.hist_quotes[pair[1]].index[-1])
-                    data_to_append = self._app.hist_quotes[pair[0]].loc[latest_common_date].to_frame("numerator").join(self._app.hist_quotes[pair[1]].loc[latest_common_date].to_frame("denominator"))
-                    data_to_append["close"] = data_to_append["numerator"]/data_to_append["denominator"]
-                    self.fast_data = self.fast_data.append(data_to_append)
-                    self.fast_data["return_vol_1h"] = self.fast_data["close"].pct_change().rolling(60).std()
-                    self.fast_data["return_vol_30m"] = self.fast_data["close"].pct_change().rolling(30).std()
-                    self.fast_data["return_vol_10m"] = self.fast_data["close"].pct_change().rolling(30).std()
-                    self.fast_data["rolling_mean"] = self.fast_data["close"].shift(30).rolling(60).mean()
-
-                prediction = self.models[tuple(pair)].predict(self.fast_data[[
-                            "close", 
-                            "return_vol_1h", 
-                            "return_vol_30m", 
-                            "return_vol_10m",
-                            "rolling_mean"
-                            ]].iloc[-1].to_frame().T)
-
-                if prediction == 1 and self._app.get_account().status == "ACTIVE" \
-                    and self._app.get_position(pair[0]) is None \
-                        and self._app.get_position(pair[1]) is None \
-                            and self.commitment[tuple(pair)] == False:
-                    if self.fast_data.iloc[-1]["close"] > self.fast_data.iloc[-1]["rolling_mean"] * 1.005:
-                        self._app.submit_order(pair[0], 1, "sell", "market", "day")
-                        self._app.submit_order(pair[1], 1, "buy", "market", "day")
-                    elif self.fast_data.iloc[-1]["close"] < self.fast_data.iloc[-1]["rolling_mean"] * 0.995:
-                        self._app.submit_order(pair[0], 1, "buy", "market", "day")
-                        self._app.submit_order(pair[1], 1, "sell", "market", "day")
-                elif prediction == 0:
-                    if self._app.get_position(pair[0]) is not None:
-                        self._app.submit_order(pair[0], 1, "sell", "market", "day")
-                    if self._app.get_position(pair[1]) is not None:
-                        self._app.submit_order(pair[1], 1, "sell", "market", "day")
-                    self.commitment[tuple(pair)] = False
-            time.sleep(1)
-        # on exit
-        if self._eflag.is_set():
-            self._store_features(self.temp_table)
-            pass
-    
+        # every pair with a model is scored at once from the stacked feature rows
+        self.scorer = LinearScorer({tuple(pair): self._model(pair) for pair in self.pairs})
+        self._feature_matrix = np.empty((len(self.scorer), len(FEATURES)))
+
+    async def on_event(self, event):
+        bar = event.data
+        self.panel.update(bar.symbol, bar.timestamp, bar.close)
+        if self._pending_events():
+            # a backlog, e.g. the bars queued during on_start, is applied to the panel before deciding once
+            return
+        for order in self._decide():
+            await asyncio.to_thread(self._app.submit_order, *order)
+
+    async def on_stop(self):
+        if self._eflag.is_set() and hasattr(self, "store"):
+            await asyncio.to_thread(self._store_features, self.temp_table)
+
     def end(self):
-        self._eflag.set()
+        self.stop()
+
+    def _decide(self) -> list:
+        """Advances the features of the pairs with new closes and returns the orders their predictions call for."""
+        updated = False
+        for pair in self.pairs:
+            common_column = self._common_column(pair)
+            if common_column > self._last_column[tuple(pair)]:
+                # every minute both symbols have a close since the last update, as train() sees them
+                for close in self.panel.ratio(pair[0], pair[1], self._last_column[tuple(pair)] + 1, common_column + 1):
+                    self.features[tuple(pair)] = self.engines[tuple(pair)].update(close)
+                self._last_column[tuple(pair)] = common_column
+                updated = True
+        if not updated:
+            return []
+        feature_matrix = self._feature_matrix
+        for row, pair in enumerate(self.scorer.keys):
+            feature_matrix[row] = self.features[pair]
+
+        orders = []
+        account = self._app.getAccount()
+        for pair, prediction, features in zip(*self.scorer.score_ready(feature_matrix)):
+            close, rolling_mean = features[0], features[-1]
+
+            if prediction == 1 and account is not None and account.status == "ACTIVE" \
+                and self._app.getPosition(pair[0]) is None \
+                    and self._app.getPosition(pair[1]) is None \
+                        and self.commitment[tuple(pair)] == False:
+                if close > rolling_mean * 1.005:
+                    orders.append((pair[0], 1, "sell", "market", "day"))
+                    orders.append((pair[1], 1, "buy", "market", "day"))
+                elif close < rolling_mean * 0.995:
+                    orders.append((pair[0], 1, "buy", "market", "day"))
+                    orders.append((pair[1], 1, "sell", "market", "day"))
+            elif prediction == 0:
+                if self._app.getPosition(pair[0]) is not None:
+                    orders.append((pair[0], 1, "sell", "market", "day"))
+                if self._app.getPosition(pair[1]) is not None:
+                    orders.append((pair[1], 1, "sell", "market", "day"))
+                self.commitment[tuple(pair)] = False
+        return orders
+
+    @property
+    def panel(self) -> PricePanel:
+        # built once from temp_table, then kept current by the streamed bars
+        if self._panel is None:
+            self._panel = PricePanel.from_table(self.temp_table) if not self.temp_table.empty else PricePanel([])
+        return self._panel
+
+    def _common_column(self, pair) -> int:
+        return min(self.panel.last_column(pair[0]), self.panel.last_column(pair[1]))
     
     def _download_latest_data(self):
         if self.temp_table.empty:
@@ -111,58 +145,98 @@ class PairsTradingStrategy(BaseStrategy):
         super().handle_training()
         
         self._manage_data()
-
-        if self.last_updated is not None and self.last_updated > pd.Timestamp.now() - pd.Timedelta(days=7) and not hard:
-            self.train(hard=True)
-        else:
-            self.train()
+        # pairs whose training data did not change keep their stored model
+        self.train(hard=hard)
         
         self._store_features(self.temp_table)
 
     def train(self, hard: bool = False):
-        for pair in self.pairs:
-            ass_numerator = pair[0]
-            ass_denominator = pair[1]
-            logging.debug(f"Training model for {ass_numerator, ass_denominator}...")
-            numerator = self.temp_table[self.temp_table["symbol"] == ass_numerator].copy()
-            denominator = self.temp_table[self.temp_table["symbol"] == ass_denominator].copy()
-            numerator.drop(columns=["symbol"], inplace=True)
-            denominator.drop(columns=["symbol"], inplace=True)
-            numerator["timestamp"] = pd.to_datetime(numerator["timestamp"], format="%Y-%m-%d %H:%M:%S+00:00", utc = True)
-            numerator = numerator.set_index('timestamp').resample('T').ffill()
-            denominator["timestamp"] = pd.to_datetime(denominator["timestamp"], format="%Y-%m-%d %H:%M:%S+00:00", utc = True)
-            denominator = denominator.set_index('timestamp').resample('T').ffill()
-            df_resampled = pd.concat([numerator["close"].to_frame("numerator"), denominator["close"].to_frame("denominator")], axis=1)
-            df_resampled.dropna(inplace=True)
-            df_resampled["close"] = df_resampled["numerator"]/df_resampled["denominator"]
-            df_resampled["return_vol_1h"] = df_resampled["close"].pct_change().rolling(60).std()
-            df_resampled["return_vol_30m"] = df_resampled["close"].pct_change().rolling(30).std()
-            df_resampled["return_vol_10m"] = df_resampled["close"].pct_change().rolling(30).std()
-            df_resampled["rolling_mean"] = df_resampled["close"].shift(30).rolling(60).mean()
-            df_resampled.dropna(inplace=True)
-            df_resampled["reversal"] = None
-            # assign reversal to 1 if df["close"] is within 10% of the mean now or in the next 30 minutes
-            for num, idx in enumerate(df_resampled.index):
-                if num + 30 > len(df_resampled):
-                    break
-                if any(df_resampled["close"].iloc[num:num+30] >= df_resampled["rolling_mean"].iloc[num:num+30] * 1.005) or any(df_resampled["close"].iloc[num:num+30] <= df_resampled["rolling_mean"].iloc[num:num+30] * 0.995):
-                    df_resampled.loc[idx, "reversal"] = 1
-                else:
-                    df_resampled.loc[idx, "reversal"] = 0
-            df_resampled.to_csv("fun.csv")
-            df_resampled.dropna(inplace=True)
-
-            X = df_resampled[["close", "return_vol_1h", "return_vol_30m", "return_vol_10m", "rolling_mean"]].shift(1).dropna()
-            X = X.astype(np.float64)
-            y = df_resampled["reversal"].iloc[1:]
-
-            if tuple(pair) not in self.models or hard:
-                self.models[tuple(pair)] = self.model_template
-
-            self.models[tuple(pair)].fit(X, y)    
+        """Fits the model of every pair in a process pool, skipping pairs whose stored model was trained on identical data.
+
+        Keyword arguments:
+        hard -- refit every pair even if its stored model is current (default False)
+        """
+        panel = self.panel
+        pairs = [tuple(pair) for pair in self.pairs if pair[0] in panel.rows and pair[1] in panel.rows]
+        if not pairs:
+            return
+        values = panel.values
+        # the panel is copied once into shared memory, workers read their two rows from it
+        shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        try:
+            np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+            # workers are spawned, forking a process running stream and event loop threads can deadlock the child
+            with ProcessPoolExecutor(max_workers=self.training_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {}
+                for pair in pairs:
+                    entry = self.registry.entry(self._model_key(pair))
+                    current = None if hard or entry is None else entry["fingerprint"]
+                    logging.debug(f"Training model for {pair}...")
+                    futures[pair] = pool.submit(fit_pair, shm.name, values.shape, panel.start, panel.freq,
+                                                (panel.rows[pair[0]], panel.rows[pair[1]]), current)
+                for pair, future in futures.items():
+                    try:
+                        fingerprint, model = future.result()
+                    except Exception as e:
+                        logging.error(f"Training failed for {pair}: {e}")
+                        continue
+                    if model is None:
+                        logging.debug(f"Model for {pair} is up to date")
+                        continue
+                    version = self.registry.save(self._model_key(pair), model, fingerprint)
+                    self.models[pair] = model
+                    logging.debug(f"Stored version {version} of the model for {pair}")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def screen(self, universe: list[str] = None, top_k: int = 20, **screen_params) -> pd.DataFrame:
+        """Ranks the pairs of a universe from the stored bars and trades the `top_k` best, saving them as the strategy's pairs.
+
+        Keyword arguments:
+        universe -- symbols to screen (default None, every symbol in the bar store)
+        top_k -- number of pairs kept (default 20)
+        screen_params -- forwarded to pair_screening.screen_pairs
+        Return: pandas.DataFrame of every pair passing the screen, best first
+        """
+        universe = list(universe) if universe is not None else list(self.store.last_timestamps())
+        bars = self.store.frame(universe, start=pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=self._HISTORY_DAYS))
+        panel = PricePanel.from_table(bars)
+        values = panel.values
+        rows = np.flatnonzero((~np.isnan(values)).mean(axis=1) >= self._MIN_COVERAGE) if values.size else np.empty(0, int)
+        prices = values[rows]
+        # minutes where every screened symbol has a price
+        prices = prices[:, ~np.isnan(prices).any(axis=0)]
+        logging.debug(f"Screening {len(rows)} of {len(universe)} symbols over {prices.shape[1]} minutes...")
+        ranked = screen_pairs(prices.T, [panel.symbols[row] for row in rows],
+                              workers=self.training_workers, **screen_params)
+        pairs = top_pairs(ranked, top_k)
+        if not pairs:
+            logging.warning(f"No pair of {len(rows)} symbols passed the screen, keeping the configured pairs")
+            return ranked
+        self.pairs = pairs
+        self._update_client_params(pairs=pairs)
+        logging.info(f"Screened pairs: {pairs}")
+        return ranked
+
+    @staticmethod
+    def _model_key(pair) -> str:
+        return ModelRegistry.key(*pair)
+
+    def _model(self, pair):
+        pair = tuple(pair)
+        if pair not in self.models:
+            self.models[pair] = self.registry.load(self._model_key(pair))
+        return self.models[pair]
  
+    def _pair_close(self, pair) -> pd.Series:
+        """Returns the minute series of the ratio between the closes of a pair's two symbols."""
+        if pair[0] not in self.panel.rows or pair[1] not in self.panel.rows:
+            return pd.Series(dtype=np.float64)
+        return self.panel.ratio(pair[0], pair[1])
+
     def predict(self, symbol: str, X: pd.DataFrame):
-        return self.models[symbol].predict(X)
+        return self._model(symbol).predict(X)
 
     def _get_data(self, subset: list | str = None, start_date: dt.datetime = None, end_date: dt.datetime = None):
         if subset is None:
@@ -170,12 +244,17 @@ class PairsTradingStrategy(BaseStrategy):
         
         logging.debug(f"Downloading data for {len(subset)} symbols through Alpaca's API...")
         
-        chunk_to_append = self._app.get_bars(subset, "1Min", self._app._fmt_date(start_date), self._app._fmt_date(end_date)).df
+        if start_date is None:
+            start_date = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=self._HISTORY_DAYS)
+        chunk_to_append = self._app.getBars(subset, "1Min", start_date, end_date)
 
         logging.debug(f"Downloaded data for {len(subset)} symbols through Alpaca's API.")
-        chunk_to_append.reset_index(inplace=True)
         chunk_to_append.dropna(inplace=True)
+        # ranges overlapping what is already loaded are served from the bar cache, keep one row per bar
         self.temp_table = pd.concat([self.temp_table, chunk_to_append])
+        self.temp_table["timestamp"] = pd.to_datetime(self.temp_table["timestamp"], utc=True)
+        self.temp_table = self.temp_table.drop_duplicates(["symbol", "timestamp"], keep="last").reset_index(drop=True)
+        self._panel = None
         return self.temp_table
     
     def _extract_features(self, start_date: dt.datetime = None, end_date: dt.datetime = None):
@@ -186,65 +265,50 @@ class PairsTradingStrategy(BaseStrategy):
         end_date -- end date of the data to extract (default None)
         Return: pandas.DataFrame
         """
-        
-        cursor = self.conn.cursor()
-        cursor.execute(f"SELECT * FROM {self.table_name}")
-        rows = cursor.fetchall()
-        column_names = [description[0] for description in cursor.description]
-        df = pd.DataFrame(rows, columns=column_names)
+        symbols = {elem for pair in self.pairs for elem in pair}
+        df = self.store.frame(symbols, start_date, end_date)
+        self._stored_until.update(self.store.last_timestamps(symbols))
         return df
     
     def _store_features(self, df: pd.DataFrame):
-        """Stores the features of the model in the database.
+        """Stores the features of the model in the database, writing only rows newer than what is already stored.
         
         Keyword arguments:
         df -- dataframe representing the features of the model
         """
-        df.to_sql(self.table_name, self.conn, if_exists="replace", index=False)
-        self.conn.commit()
-        logging.debug("Stored features in database.")
+        if df.empty:
+            return
+        timestamps = pd.DatetimeIndex(pd.to_datetime(df["timestamp"], utc=True)).asi8
+        symbols = df["symbol"].to_numpy()
+        new = np.ones(len(df), dtype=bool)
+        for symbol in pd.unique(symbols):
+            if symbol in self._stored_until:
+                new &= (symbols != symbol) | (timestamps > self._stored_until[symbol])
+        new_rows = df[new]
+        written = self.store.upsert(new_rows)
+        if written:
+            self._stored_until.update(self.store.last_timestamps(new_rows["symbol"].unique()))
+        logging.debug(f"Stored {written} new rows of features in database.")
 
     @staticmethod
-    def _worst_last_date(df: pd.DataFrame) -> np.datetime64:
+    def _worst_last_date(df: pd.DataFrame) -> pd.Timestamp:
         """Returns the worst last date of the dataframe.
         
         Keyword arguments:
         df -- dataframe to check
-        Return: numpy.datetime64
+        Return: pandas.Timestamp (UTC)
         """
-        date = df.groupby("symbol").agg({"timestamp": "max"}).min().values[0]
-        if isinstance(date, str):
-            return dt.datetime.strptime(date, "%Y-%m-%d %H:%M:%S+00:00")
-        return date
+        return pd.to_datetime(df["timestamp"], utc=True).groupby(df["symbol"]).max().min()
 
     def _manage_data(self):
         if self.temp_table.empty:
-            if self._pairs_trading_table_exists():
-                self.temp_table = self._extract_features()
-                if self.temp_table.empty:
-                    self._get_data()
-            else:
-                self._create_pairs_trading_table()
+            self.temp_table = self._extract_features(start_date=pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=self._HISTORY_DAYS))
+            self._panel = None
+            if self.temp_table.empty:
                 self._get_data()
 
 
         worst_last_date = self._worst_last_date(self.temp_table)
-        if worst_last_date < pd.Timestamp.now() - pd.Timedelta(days=1):
+        if worst_last_date < pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=1):
             self._get_data(start_date=worst_last_date)
 
-    def _pairs_trading_table_exists(self):
-        c = self.conn.cursor()
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pairs_trading'")
-        return bool(c.fetchone())
-    
-    def _create_pairs_trading_table(self):
-        c = self.conn.cursor()
-        c.execute("CREATE TABLE pairs_trading (symbol TEXT, timestamp TIMESTAMP, open REAL, high REAL, low REAL, close REAL, volume INTEGER, vwap REAL, trade_count INTEGER)")
-        self.conn.commit()
-
-    @classmethod
-    def _model_exists(cls):
-        return os.path.exists(cls._MODEL_PATH)
-
-    def _save_model(self):
-        pickle.dump(self.models, "")
@@ -0,0 +1,62 @@
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from .model_registry import ModelRegistry
+from .pairs_features import FEATURES, pair_features, reversal_labels
+from trading.price_panel import ratio_series
+
+
+def new_pipeline() -> Pipeline:
+    return Pipeline([
+        ("StandardScaler", StandardScaler()),
+        ("regressor", LinearRegression())
+    ])
+
+
+def training_set(close: pd.Series) -> Tuple[pd.DataFrame, pd.Series]:
+    """Features of each minute of a pair's ratio series and the reversal label of the next minute."""
+    df_resampled = pair_features(close)
+    df_resampled.dropna(inplace=True)
+    # assign reversal to 1 if df["close"] leaves the band around the mean now or in the next 30 minutes
+    df_resampled["reversal"] = reversal_labels(df_resampled["close"], df_resampled["rolling_mean"])
+    df_resampled.dropna(inplace=True)
+
+    X = df_resampled[FEATURES].shift(1).dropna()
+    X = X.astype(np.float64)
+    y = df_resampled["reversal"].iloc[1:]
+    return X, y
+
+
+def fit_pair(shm_name: str, shape: Tuple[int, int], start: int, freq: int, rows: Tuple[int, int],
+             current_fingerprint: Optional[str] = None) -> Tuple[str, Optional[Pipeline]]:
+    """Trains the model of one pair in a worker process, reading the price panel from shared memory.
+
+    Keyword arguments:
+    shm_name -- name of the shared memory block holding the panel values
+    shape -- shape of the panel values
+    start -- timestamp of the panel's first column in epoch nanoseconds
+    freq -- width of a panel column in nanoseconds
+    rows -- panel rows of the numerator and denominator symbols
+    current_fingerprint -- fingerprint of the stored model's training data, fitting is skipped if it matches (default None)
+    Return: fingerprint of the training data and the fitted pipeline, None if the stored model is current
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        close = ratio_series(values[rows[0]], values[rows[1]], start, freq)
+        del values
+    finally:
+        shm.close()
+    X, y = training_set(close)
+    fingerprint = ModelRegistry.fingerprint(X.to_numpy(), y.to_numpy(dtype=np.float64))
+    if fingerprint == current_fingerprint:
+        return fingerprint, None
+    model = new_pipeline()
+    model.fit(X, y)
+    return fingerprint, model
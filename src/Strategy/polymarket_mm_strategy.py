@@ -1,7 +1,7 @@
 from .base_strategy import BaseStrategy
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
-from Gateway import PolymarketGateway
+from Gateway import PolymarketGateway, ReplayGateway
 from sklearn.linear_model import LinearRegression
 from typing import List
 
@@ -9,8 +9,9 @@ class PolymarketMMStrategy(BaseStrategy):
     NAME = "Polymarket Market Maker Strategy"
     cli_cmd = "pmms"
     def __init__(self, gateways: List[PolymarketGateway], **kwargs):
-        if not isinstance(gateways[0], PolymarketGateway) or len(gateways) != 1:
-            raise Exception("PolymarketMMStrategy only works with PolymarketGateway")
+        # a ReplayGateway serves recorded Polymarket sessions through the same book API
+        if not isinstance(gateways[0], (PolymarketGateway, ReplayGateway)) or len(gateways) != 1:
+            raise Exception("PolymarketMMStrategy only works with a single PolymarketGateway or ReplayGateway")
         super().__init__(gateways, **kwargs)
 
     def begin(self):
@@ -0,0 +1,109 @@
+from collections import namedtuple
+from typing import Callable, Dict, List
+
+Bar = namedtuple("Bar", ["symbol", "timestamp", "open", "high", "low", "close", "volume", "vwap", "trade_count"])
+
+_MINUTE_NS = 60_000_000_000
+
+
+class _OpenBar:
+    __slots__ = ("start", "open", "high", "low", "close", "first", "last", "volume", "notional", "trade_count")
+
+    def __init__(self, start: int, timestamp: int, price: float):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+        self.first = self.last = timestamp
+        self.volume = 0.0
+        self.notional = 0.0
+        self.trade_count = 0
+
+    def update(self, timestamp: int, price: float, size: float = 0.0):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        # open and close follow tick time, not arrival order, so late ticks cannot move them wrongly
+        if timestamp >= self.last:
+            self.close, self.last = price, timestamp
+        elif timestamp < self.first:
+            self.open, self.first = price, timestamp
+        if size:
+            self.volume += size
+            self.notional += price * size
+            self.trade_count += 1
+
+
+class BarAggregator:
+    """Builds time bars from streaming trades and quotes, publishing each bar once it is complete.
+
+    A tick belongs to the bar starting at `timestamp - timestamp % interval` (epoch nanoseconds, so
+    boundaries fall on whole minutes). Prices update open/high/low/close, trades also add to volume,
+    VWAP and trade count; quotes contribute their mid. A bar is closed once the symbol's newest tick,
+    or the clock passed to `flush`, is `grace` past its end, so ticks arriving slightly late still land
+    in the right bar, with open and close taken by tick time. Ticks for a bar already published are
+    counted in `late_ticks` and dropped. Minutes without ticks produce no bar.
+
+    Keyword arguments:
+    on_bar -- callback receiving every completed Bar, in time order per symbol
+    interval -- bar length in nanoseconds (default one minute)
+    grace -- how long after its end a bar still accepts ticks, in nanoseconds (default 2 seconds)
+    """
+
+    def __init__(self, on_bar: Callable[[Bar], None], interval: int = _MINUTE_NS, grace: int = 2_000_000_000):
+        self._on_bar = on_bar
+        self.interval = interval
+        self.grace = grace
+        self._open: Dict[str, List[_OpenBar]] = {}
+        self._published: Dict[str, int] = {}
+        self._watermark: Dict[str, int] = {}
+        self.late_ticks = 0
+
+    def _tick(self, symbol: str, timestamp: int, price: float, size: float):
+        start = timestamp - timestamp % self.interval
+        if start < self._published.get(symbol, -1):
+            self.late_ticks += 1
+            return
+        bars = self._open.setdefault(symbol, [])
+        # open bars are kept sorted by start, ticks almost always hit the last one
+        i = len(bars) - 1
+        while i >= 0 and bars[i].start > start:
+            i -= 1
+        if i >= 0 and bars[i].start == start:
+            bar = bars[i]
+        else:
+            bar = _OpenBar(start, timestamp, price)
+            bars.insert(i + 1, bar)
+        bar.update(timestamp, price, size)
+        if timestamp > self._watermark.get(symbol, -1):
+            self._watermark[symbol] = timestamp
+            self._close(symbol, timestamp)
+
+    def _close(self, symbol: str, now: int):
+        bars = self._open.get(symbol)
+        while bars and bars[0].start + self.interval + self.grace <= now:
+            bar = bars.pop(0)
+            self._published[symbol] = bar.start + self.interval
+            vwap = bar.notional / bar.volume if bar.volume else bar.close
+            self._on_bar(Bar(symbol, bar.start, bar.open, bar.high, bar.low, bar.close,
+                             bar.volume, vwap, bar.trade_count))
+
+    def add_trade(self, symbol: str, timestamp: int, price: float, size: float):
+        self._tick(symbol, timestamp, price, size)
+
+    def add_quote(self, symbol: str, timestamp: int, bid_price: float, ask_price: float):
+        if bid_price > 0 and ask_price > 0:
+            self._tick(symbol, timestamp, (bid_price + ask_price) / 2, 0.0)
+
+    def flush(self, now: int):
+        """Closes the bars of every symbol which ended `grace` before `now`, for symbols that stopped ticking."""
+        for symbol in list(self._open):
+            self._close(symbol, now)
+
+    def open_bar(self, symbol: str) -> Bar:
+        """Returns the newest bar of `symbol` still being built, None if there is none."""
+        bars = self._open.get(symbol)
+        if not bars:
+            return None
+        bar = bars[-1]
+        vwap = bar.notional / bar.volume if bar.volume else bar.close
+        return Bar(symbol, bar.start, bar.open, bar.high, bar.low, bar.close, bar.volume, vwap, bar.trade_count)
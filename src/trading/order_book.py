@@ -0,0 +1,297 @@
+import time
+from collections import namedtuple
+from threading import Lock
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+DepthSnapshot = namedtuple("DepthSnapshot", ["timestamp", "price", "size", "vwap"])
+
+
+class DepthLadder:
+    """One side of a level-based depth book (as sent by TWS updateMktDepth).
+
+    Levels are stored in preallocated NumPy arrays indexed by book position. Cumulative
+    notional and size are maintained lazily: an update only records the first level whose
+    prefix sums are stale, and the prefix is rebuilt from that level on the next VWAP query.
+    """
+
+    def __init__(self, capacity: int = 32):
+        self._capacity = capacity
+        self.timestamp = np.zeros(capacity, dtype=np.float64)
+        self.price = np.full(capacity, np.nan, dtype=np.float64)
+        self.size = np.zeros(capacity, dtype=np.float64)
+        self._cum_notional = np.zeros(capacity, dtype=np.float64)
+        self._cum_size = np.zeros(capacity, dtype=np.float64)
+        self.depth = 0
+        self._dirty = 0
+
+    def _reserve(self, levels: int):
+        if levels <= self._capacity:
+            return
+        capacity = max(levels, 2 * self._capacity)
+        for name, fill in (("timestamp", 0.0), ("price", np.nan), ("size", 0.0),
+                           ("_cum_notional", 0.0), ("_cum_size", 0.0)):
+            arr = np.full(capacity, fill, dtype=np.float64)
+            arr[:self._capacity] = getattr(self, name)
+            setattr(self, name, arr)
+        self._capacity = capacity
+
+    def insert(self, position: int, price: float, size: float, timestamp: float = None):
+        if position >= self.depth:
+            return self.update(position, price, size, timestamp)
+        self._reserve(self.depth + 1)
+        end = self.depth
+        for arr in (self.timestamp, self.price, self.size):
+            arr[position + 1:end + 1] = arr[position:end]
+        self.depth += 1
+        self._set(position, price, size, timestamp)
+
+    def update(self, position: int, price: float, size: float, timestamp: float = None):
+        self._reserve(position + 1)
+        if position >= self.depth:
+            # levels skipped by the feed stay empty until they are filled in
+            self.price[self.depth:position] = np.nan
+            self.size[self.depth:position] = 0.0
+            self.depth = position + 1
+        self._set(position, price, size, timestamp)
+
+    def delete(self, position: int):
+        if position >= self.depth:
+            return
+        end = self.depth
+        for arr in (self.timestamp, self.price, self.size):
+            arr[position:end - 1] = arr[position + 1:end]
+        self.depth -= 1
+        self.price[self.depth] = np.nan
+        self.size[self.depth] = 0.0
+        self._dirty = min(self._dirty, position)
+
+    def clear(self):
+        self.price[:] = np.nan
+        self.size[:] = 0.0
+        self.depth = 0
+        self._dirty = 0
+
+    def _set(self, position: int, price: float, size: float, timestamp: float):
+        self.timestamp[position] = time.time() if timestamp is None else timestamp
+        self.price[position] = price
+        self.size[position] = size
+        self._dirty = min(self._dirty, position)
+
+    def _refresh(self):
+        start, end = self._dirty, self.depth
+        if start >= end:
+            return
+        notional = np.nan_to_num(self.price[start:end] * self.size[start:end])
+        base_notional = self._cum_notional[start - 1] if start else 0.0
+        base_size = self._cum_size[start - 1] if start else 0.0
+        np.cumsum(notional, out=self._cum_notional[start:end])
+        np.cumsum(self.size[start:end], out=self._cum_size[start:end])
+        self._cum_notional[start:end] += base_notional
+        self._cum_size[start:end] += base_size
+        self._dirty = end
+
+    def vwap(self, level: int) -> float:
+        """Volume weighted average price of the book from the top down to `level` (inclusive)."""
+        if level >= self.depth:
+            return np.nan
+        self._refresh()
+        cum_size = self._cum_size[level]
+        return self._cum_notional[level] / cum_size if cum_size else np.nan
+
+    def cumulative_size(self, level: int) -> float:
+        if level >= self.depth:
+            return np.nan
+        self._refresh()
+        return self._cum_size[level]
+
+    def snapshot(self) -> DepthSnapshot:
+        """Returns read-only copies of the populated levels."""
+        self._refresh()
+        depth = self.depth
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = self._cum_notional[:depth] / self._cum_size[:depth]
+        snap = DepthSnapshot(self.timestamp[:depth].copy(), self.price[:depth].copy(),
+                             self.size[:depth].copy(), vwap)
+        for arr in snap:
+            arr.flags.writeable = False
+        return snap
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.snapshot()._asdict())
+
+
+class DepthBook:
+    """Bid and ask ladders of a single market depth subscription, each guarded by its own lock.
+
+    Indexing with "bids" or "asks" returns a DataFrame snapshot of that side, matching the
+    layout strategies used to read from `TWSGateway.books`.
+    """
+
+    SIDES = ("bids", "asks")
+
+    def __init__(self, capacity: int = 32):
+        self.bids = DepthLadder(capacity)
+        self.asks = DepthLadder(capacity)
+        self.locks = {side: Lock() for side in self.SIDES}
+
+    def apply(self, side: str, position: int, operation: int, price: float, size: float):
+        """Applies a TWS depth update (operation 0 = insert, 1 = update, 2 = delete)."""
+        ladder: DepthLadder = getattr(self, side)
+        with self.locks[side]:
+            if operation == 0:
+                ladder.insert(position, price, size)
+            elif operation == 1:
+                ladder.update(position, price, size)
+            elif operation == 2:
+                ladder.delete(position)
+
+    def snapshot(self, side: str) -> DepthSnapshot:
+        with self.locks[side]:
+            return getattr(self, side).snapshot()
+
+    def vwap(self, side: str, level: int) -> float:
+        with self.locks[side]:
+            return getattr(self, side).vwap(level)
+
+    def __getitem__(self, side: str) -> pd.DataFrame:
+        if side not in self.SIDES:
+            raise KeyError(side)
+        return pd.DataFrame(self.snapshot(side)._asdict())
+
+
+class TickBook:
+    """Price-indexed book for venues quoting on a fixed integer tick grid (e.g. cents for Kalshi).
+
+    Sizes live in flat lists indexed by tick, so applying a level is O(1) and the best price is
+    only rescanned when the best level empties. After every mutation the top of book is
+    republished as a single tuple in `top`, which readers on other threads can take without
+    locking since attribute assignment is atomic.
+    """
+
+    def __init__(self, n_ticks: int):
+        self.n_ticks = n_ticks
+        self.bids = [0.0] * (n_ticks + 1)
+        self.asks = [0.0] * (n_ticks + 1)
+        self.best_bid = -1
+        self.best_ask = n_ticks + 1
+        self.top = (None, 0.0, None, 0.0)
+        self.version = 0
+
+    def clear(self):
+        self.bids = [0.0] * (self.n_ticks + 1)
+        self.asks = [0.0] * (self.n_ticks + 1)
+        self.best_bid = -1
+        self.best_ask = self.n_ticks + 1
+        self._publish()
+
+    def _publish(self):
+        bid, ask = self.best_bid, self.best_ask
+        self.top = (bid if bid >= 0 else None, self.bids[bid] if bid >= 0 else 0.0,
+                    ask if ask <= self.n_ticks else None, self.asks[ask] if ask <= self.n_ticks else 0.0)
+        self.version += 1
+
+    def _set_bid(self, tick: int, size: float):
+        bids = self.bids
+        bids[tick] = size
+        if size > 0:
+            if tick > self.best_bid:
+                self.best_bid = tick
+        elif tick == self.best_bid:
+            while tick >= 0 and bids[tick] <= 0:
+                tick -= 1
+            self.best_bid = tick
+
+    def _set_ask(self, tick: int, size: float):
+        asks = self.asks
+        asks[tick] = size
+        if size > 0:
+            if tick < self.best_ask:
+                self.best_ask = tick
+        elif tick == self.best_ask:
+            last = self.n_ticks
+            while tick <= last and asks[tick] <= 0:
+                tick += 1
+            self.best_ask = tick
+
+    def set_level(self, is_bid: bool, tick: int, size: float):
+        if is_bid:
+            self._set_bid(tick, size)
+        else:
+            self._set_ask(tick, size)
+        self._publish()
+
+    def add_level(self, is_bid: bool, tick: int, delta: float):
+        if is_bid:
+            self._set_bid(tick, max(self.bids[tick] + delta, 0.0))
+        else:
+            self._set_ask(tick, max(self.asks[tick] + delta, 0.0))
+        self._publish()
+
+    def load(self, bids, asks):
+        """Replaces the whole book with iterables of (tick, size) levels."""
+        self.bids = [0.0] * (self.n_ticks + 1)
+        self.asks = [0.0] * (self.n_ticks + 1)
+        best_bid, best_ask = -1, self.n_ticks + 1
+        for tick, size in bids:
+            if size > 0:
+                self.bids[tick] = size
+                best_bid = max(best_bid, tick)
+        for tick, size in asks:
+            if size > 0:
+                self.asks[tick] = size
+                best_ask = min(best_ask, tick)
+        self.best_bid, self.best_ask = best_bid, best_ask
+        self._publish()
+
+    def best(self):
+        """Returns (best bid tick, bid size, best ask tick, ask size), ticks being None on an empty side."""
+        return self.top
+
+    def mid(self):
+        """Midpoint in ticks, None unless both sides are quoted."""
+        bid, _, ask, _ = self.top
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def microprice(self):
+        """Top of book size-weighted price in ticks, None unless both sides are quoted."""
+        bid, bid_size, ask, ask_size = self.top
+        if bid is None or ask is None:
+            return None
+        return (bid * ask_size + ask * bid_size) / (bid_size + ask_size)
+
+    def depth(self, is_bid: bool, levels: int):
+        """Returns up to `levels` non-empty (tick, size) levels starting from the best price."""
+        out = []
+        if is_bid:
+            sizes, tick, step, stop = self.bids, self.best_bid, -1, -1
+        else:
+            sizes, tick, step, stop = self.asks, self.best_ask, 1, self.n_ticks + 1
+        while tick != stop and len(out) < levels:
+            if sizes[tick] > 0:
+                out.append((tick, sizes[tick]))
+            tick += step
+        return out
+
+
+_TICK_CACHE: Dict[Tuple[str, int], int] = {}
+
+
+def price_to_ticks(price: str, decimals: int) -> int:
+    """Converts a decimal price string (e.g. "0.485") to an integer number of 10^-decimals ticks without going through float.
+
+    Venues only quote a few hundred distinct price strings, so conversions are memoized. A price
+    finer than the grid raises ValueError rather than being truncated onto a neighbouring tick.
+    """
+    ticks = _TICK_CACHE.get((price, decimals))
+    if ticks is None:
+        whole, _, frac = price.partition(".")
+        if frac[decimals:].strip("0"):
+            raise ValueError(f"Price {price} has more than {decimals} decimals")
+        ticks = int(whole or 0) * 10 ** decimals + int((frac + "0" * decimals)[:decimals])
+        _TICK_CACHE[(price, decimals)] = ticks
+    return ticks
@@ -0,0 +1,144 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+_MINUTE_NS = 60_000_000_000
+
+
+def ratio_series(numerator: np.ndarray, denominator: np.ndarray, start: int, freq: int = _MINUTE_NS,
+                 begin: int = 0) -> pd.Series:
+    """Ratio of two aligned panel rows on the columns where both have a value, indexed by UTC time.
+
+    Keyword arguments:
+    numerator -- panel row, or a slice of it starting at column `begin`
+    denominator -- panel row aligned with `numerator`
+    start -- timestamp of column 0 in epoch nanoseconds
+    freq -- width of a column in nanoseconds (default one minute)
+    begin -- panel column of the first element of the rows (default 0)
+    Return: pandas.Series
+    """
+    ratio = numerator / denominator
+    keep = np.flatnonzero(~np.isnan(ratio))
+    index = pd.to_datetime((start or 0) + freq * (begin + keep), utc=True)
+    return pd.Series(ratio[keep], index=index.rename("timestamp"))
+
+
+class PricePanel:
+    """Closes of many symbols on one shared minute grid, stored as a symbols x minutes NumPy array.
+
+    Each symbol is forward filled between its first and last observation and NaN outside, which is
+    what resampling each symbol on its own with `resample('T').ffill()` and aligning them gives, but
+    every symbol is parsed and aligned once however many pairs it appears in. Rows are views, so pair
+    ratios are a single vectorized division. `update` appends streamed closes, growing the grid
+    geometrically; an empty panel starts its grid at the first update.
+    """
+
+    def __init__(self, symbols: List[str], start: int = None, freq: int = _MINUTE_NS, capacity: int = 1024):
+        self.symbols = list(symbols)
+        self.rows: Dict[str, int] = {symbol: row for row, symbol in enumerate(self.symbols)}
+        self.start = None if start is None else start - start % freq
+        self.freq = freq
+        self._values = np.full((len(self.symbols), max(1, capacity)), np.nan)
+        self._first = np.full(len(self.symbols), -1, dtype=np.int64)
+        self._last = np.full(len(self.symbols), -1, dtype=np.int64)
+        self._width = 0
+
+    @classmethod
+    def from_table(cls, table: pd.DataFrame, value: str = "close", freq: int = _MINUTE_NS) -> "PricePanel":
+        """Builds a panel from a long table with symbol, timestamp and `value` columns."""
+        symbols = list(pd.unique(table["symbol"]))
+        timestamps = pd.DatetimeIndex(pd.to_datetime(table["timestamp"], utc=True)).asi8
+        if not len(timestamps):
+            return cls(symbols, None, freq)
+        start = int(timestamps.min())
+        panel = cls(symbols, start, freq, capacity=int((timestamps.max() - start) // freq) + 1)
+        rows = pd.Series(panel.rows)[table["symbol"].to_numpy()].to_numpy()
+        columns = (timestamps - panel.start) // freq
+        # later rows win when a symbol has several values in one minute
+        panel._values[rows, columns] = table[value].to_numpy(dtype=np.float64)
+        panel._width = int(columns.max()) + 1
+        observed = ~np.isnan(panel._values[:, :panel._width])
+        has_values = observed.any(axis=1)
+        panel._first = np.where(has_values, observed.argmax(axis=1), -1)
+        panel._last = np.where(has_values, panel._width - 1 - observed[:, ::-1].argmax(axis=1), -1)
+        panel._fill()
+        return panel
+
+    def _fill(self):
+        """Forward fills every row between its first and last value."""
+        block = self._values[:, :self._width]
+        observed = ~np.isnan(block)
+        positions = np.where(observed, np.arange(self._width), 0)
+        np.maximum.accumulate(positions, axis=1, out=positions)
+        filled = np.take_along_axis(block, positions, axis=1)
+        columns = np.arange(self._width)
+        filled[(columns < self._first[:, None]) | (columns > self._last[:, None])] = np.nan
+        self._values[:, :self._width] = filled
+
+    def _grow(self, width: int):
+        capacity = self._values.shape[1]
+        if width <= capacity:
+            return
+        grown = np.full((len(self.symbols), max(width, 2 * capacity)), np.nan)
+        grown[:, :self._width] = self._values[:, :self._width]
+        self._values = grown
+
+    def add_symbol(self, symbol: str):
+        if symbol in self.rows:
+            return
+        self.rows[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        self._values = np.vstack([self._values, np.full((1, self._values.shape[1]), np.nan)])
+        self._first = np.append(self._first, -1)
+        self._last = np.append(self._last, -1)
+
+    def update(self, symbol: str, timestamp: int, value: float):
+        """Records the close of `symbol` at `timestamp` (epoch nanoseconds), forward filling the minutes since its last one."""
+        if symbol not in self.rows:
+            self.add_symbol(symbol)
+        row = self.rows[symbol]
+        if self.start is None:
+            self.start = timestamp - timestamp % self.freq
+        column = (timestamp - self.start) // self.freq
+        if column < 0:
+            raise ValueError(f"{symbol} update at {timestamp} is before the start of the panel")
+        self._grow(column + 1)
+        last = self._last[row]
+        if last >= 0 and column > last + 1:
+            self._values[row, last + 1:column] = self._values[row, last]
+        self._values[row, column] = value
+        if self._first[row] < 0:
+            self._first[row] = column
+        if column > last:
+            self._last[row] = column
+        self._width = max(self._width, column + 1)
+
+    def __len__(self):
+        return self._width
+
+    @property
+    def values(self) -> np.ndarray:
+        """View of the filled part of the panel, one row per symbol."""
+        return self._values[:, :self._width]
+
+    @property
+    def timestamps(self) -> pd.DatetimeIndex:
+        return pd.to_datetime((self.start or 0) + self.freq * np.arange(self._width), utc=True)
+
+    def timestamp(self, column: int) -> int:
+        return self.start + column * self.freq
+
+    def last_column(self, symbol: str) -> int:
+        """Column of the latest value of `symbol`, -1 if it has none."""
+        row = self.rows.get(symbol)
+        return -1 if row is None else int(self._last[row])
+
+    def row(self, symbol: str) -> np.ndarray:
+        """View of the values of `symbol` over the whole grid, NaN outside its first and last value."""
+        return self._values[self.rows[symbol], :self._width]
+
+    def ratio(self, numerator: str, denominator: str, begin: int = 0, end: int = None) -> pd.Series:
+        """Returns numerator / denominator over columns [begin, end), on the minutes where both have a value."""
+        end = self._width if end is None else end
+        return ratio_series(self.row(numerator)[begin:end], self.row(denominator)[begin:end], self.start, self.freq, begin)
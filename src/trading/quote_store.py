@@ -0,0 +1,89 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+QuoteRow = namedtuple("QuoteRow", ["timestamp", "bid_price", "ask_price", "bid_size", "ask_size"])
+
+SPILL_DTYPE = np.dtype([("timestamp", np.int64), ("bid_price", np.float64), ("ask_price", np.float64),
+                        ("bid_size", np.float64), ("ask_size", np.float64)])
+
+
+class QuoteRing:
+    """Fixed-capacity quote history of one symbol stored as NumPy columns (timestamps in epoch nanoseconds).
+
+    Every row is written twice, at `i` and `i + capacity`, so the last `capacity` rows always form a
+    contiguous slice and time windows are returned as zero-copy views. Views alias the ring and are
+    overwritten once it wraps past them; copy them to keep data longer. When `spill_path` is set, each
+    full lap is appended to that file (see `load_spill`) before the ring starts overwriting it.
+    """
+
+    def __init__(self, capacity: int = 1 << 16, spill_path: str = None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._timestamp = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((4, 2 * capacity), dtype=np.float64)
+        self._count = 0
+        self._latest: QuoteRow = None
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, timestamp: int, bid_price: float, ask_price: float, bid_size: float, ask_size: float):
+        capacity = self.capacity
+        i = self._count % capacity
+        self._timestamp[i] = self._timestamp[i + capacity] = timestamp
+        values = self._values
+        values[0, i] = values[0, i + capacity] = bid_price
+        values[1, i] = values[1, i + capacity] = ask_price
+        values[2, i] = values[2, i + capacity] = bid_size
+        values[3, i] = values[3, i + capacity] = ask_size
+        self._count += 1
+        self._latest = QuoteRow(timestamp, bid_price, ask_price, bid_size, ask_size)
+        if i == capacity - 1 and self.spill_path is not None:
+            self._spill()
+
+    def _spill(self):
+        lap = np.empty(self.capacity, dtype=SPILL_DTYPE)
+        lap["timestamp"] = self._timestamp[:self.capacity]
+        for row, name in enumerate(SPILL_DTYPE.names[1:]):
+            lap[name] = self._values[row, :self.capacity]
+        dirname = os.path.dirname(self.spill_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(self.spill_path, "ab") as f:
+            lap.tofile(f)
+
+    @staticmethod
+    def load_spill(path: str) -> np.ndarray:
+        return np.fromfile(path, dtype=SPILL_DTYPE)
+
+    def latest(self) -> QuoteRow:
+        """Most recent quote, None if nothing was received yet."""
+        return self._latest
+
+    def latest_timestamp(self) -> int:
+        return self._latest.timestamp if self._latest is not None else None
+
+    def latest_mid(self) -> float:
+        return (self._latest.bid_price + self._latest.ask_price) / 2 if self._latest is not None else None
+
+    def _bounds(self):
+        n = len(self)
+        start = (self._count - n) % self.capacity if n else 0
+        return start, start + n
+
+    def window(self, start: int = None, end: int = None) -> QuoteRow:
+        """Returns views of the stored quotes with start <= timestamp < end (nanoseconds, unbounded when None)."""
+        lo, hi = self._bounds()
+        timestamps = self._timestamp[lo:hi]
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        lo, hi = lo + first, lo + last
+        return QuoteRow(self._timestamp[lo:hi], *(self._values[row, lo:hi] for row in range(4)))
+
+    def last(self, n: int) -> QuoteRow:
+        """Returns views of the `n` most recent quotes."""
+        lo, hi = self._bounds()
+        lo = max(lo, hi - n)
+        return QuoteRow(self._timestamp[lo:hi], *(self._values[row, lo:hi] for row in range(4)))
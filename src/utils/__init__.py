@@ -1,3 +1,5 @@
 from .args_template import ARGUMENT_TEMPLATES
 from .logging_utils import init_logging
-from .helpers import get_leaf_classes
\ No newline at end of file
+from .helpers import get_leaf_classes
+from .buffers import ColumnBuffer, concat_tagged
+from .async_bridge import LoopBridge
\ No newline at end of file
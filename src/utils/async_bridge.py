@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from threading import Lock
+from typing import Callable, List
+
+
+class LoopBridge:
+    """Hands items produced on foreign threads to a handler running on an asyncio event loop.
+
+    Items are buffered under a lock and the loop is woken at most once per batch, so a burst
+    of callbacks costs a single `call_soon_threadsafe` instead of one per item.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, handler: Callable[[List], None], max_batch: int = 1000):
+        self._loop = loop
+        self._handler = handler
+        self._max_batch = max_batch
+        self._lock = Lock()
+        self._items: List = []
+        self._scheduled = False
+
+    def post(self, item):
+        with self._lock:
+            self._items.append(item)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # loop already closed, nothing left to deliver to
+            pass
+
+    def backlog(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def _drain(self):
+        with self._lock:
+            batch, self._items = self._items[:self._max_batch], self._items[self._max_batch:]
+            self._scheduled = bool(self._items)
+        if self._scheduled:
+            # yield to other tasks before handling the rest of a large backlog
+            self._loop.call_soon(self._drain)
+        try:
+            self._handler(batch)
+        except Exception as e:
+            logging.error(f"Error while handling bridged batch: {e}")
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Sequence, Tuple
+
+
+class ColumnBuffer:
+    """Append-only table stored as one typed NumPy array per column.
+
+    Arrays grow geometrically, so appending n rows costs O(n) amortized instead of the
+    O(n^2) of growing a DataFrame row by row. Call `to_frame` once the data is complete.
+    """
+
+    def __init__(self, dtypes: Dict[str, type], capacity: int = 256):
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self._capacity = capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        self._capacity = max(1, 2 * self._capacity)
+        for name, arr in self._columns.items():
+            grown = np.empty(self._capacity, dtype=arr.dtype)
+            grown[:self._size] = arr[:self._size]
+            self._columns[name] = grown
+
+    def append(self, *values):
+        if self._size == self._capacity:
+            self._grow()
+        for arr, value in zip(self._columns.values(), values):
+            arr[self._size] = value
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns a view of the filled part of a column."""
+        return self._columns[name][:self._size]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {name: arr[:self._size] for name, arr in self._columns.items()}
+
+    def to_frame(self, index: str = None) -> pd.DataFrame:
+        df = pd.DataFrame(self.columns())
+        if index is not None:
+            df = df.set_index(index)
+        return df
+
+
+def concat_tagged(frames: Sequence[Tuple[str, pd.DataFrame]], tag: str, index_name: str = None) -> pd.DataFrame:
+    """Concatenates same-layout frames in a single pass, adding a `tag` column holding each frame's label.
+
+    Keyword arguments:
+    frames -- sequence of (label, frame) pairs, frames that are None are skipped
+    tag -- name of the column receiving the labels
+    index_name -- if given, the index of each frame is kept as a column with this name (default None)
+    Return: pandas.DataFrame
+    """
+    frames = [(label, df) for label, df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=([index_name] if index_name else []) + [tag])
+    data = {}
+    if index_name is not None:
+        data[index_name] = np.concatenate([df.index.to_numpy() for _, df in frames])
+    data[tag] = np.repeat(np.array([label for label, _ in frames], dtype=object), [len(df) for _, df in frames])
+    for col in frames[0][1].columns:
+        data[col] = np.concatenate([df[col].to_numpy() for _, df in frames])
+    return pd.DataFrame(data)